@@ -0,0 +1,309 @@
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+import xml.etree.ElementTree as ET
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, ".."))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "scraping"))
+sys.path.insert(0, BENCH_DIR)
+from common.pubdate import parse_pub_date  # noqa: E402
+from pubmed_parser import parse_pubmed_xml  # noqa: E402
+from synthetic_corpus import article_xml, generate_corpus  # noqa: E402
+
+BASE_PATH = "/entrez/eutils"
+ESEARCH_MAX_RETMAX = 10000  # come NCBI: esearch restituisce al massimo 10.000 ID per richiesta
+ESEARCH_MAX_RECORDS = 9999  # e solo i primi 9.999 record della query (retstart > 9998 → errore)
+# Filtro per data come lo costruisce lo scraper big-data: ("2020/01/01"[PDAT] : "2020/12/31"[PDAT])
+PDAT_RE = re.compile(r'"(\d{4})/(\d{2})/(\d{2})"\[PDAT\]\s*:\s*"(\d{4})/(\d{2})/(\d{2})"\[PDAT\]')
+
+
+def search_date(raw):
+    # Data come YYYYMMDD per i filtri [PDAT]; mese/giorno mancanti valgono 01, così ogni articolo cade in un solo intervallo
+    year, month, day = parse_pub_date(raw)
+    return year * 10000 + (month or 1) * 100 + (day or 1) if year else 0
+
+
+class MockCorpus:
+    """
+    Articoli serviti dal server: PMID → (data YYYYMMDD, XML dell'elemento <PubmedArticle>), nell'ordine di inserimento.
+    """
+
+    def __init__(self):
+        self.articles = {}
+
+    @classmethod
+    def synthetic(cls, n, seed=0):
+        corpus = cls()
+        for art in generate_corpus(n, seed=seed):
+            corpus.articles[art["pmid"]] = (search_date(art["pub_date"]), article_xml(art).encode("utf-8"))
+        return corpus
+
+    @classmethod
+    def from_fixtures(cls, paths):
+        """
+        Corpus da risposte efetch registrate (file XML `PubmedArticleSet`, es. salvati con curl da NCBI).
+        """
+        corpus = cls()
+        for path in paths:
+            with open(path, "rb") as f:
+                data = f.read()
+            dates = {r["pmid"]: search_date(r["pub_date"]) for r in parse_pubmed_xml(data)}
+            for element in ET.fromstring(data).iter("PubmedArticle"):
+                pmid = element.findtext("MedlineCitation/PMID", "").strip()
+                if pmid:
+                    corpus.articles[pmid] = (dates.get(pmid, 0), ET.tostring(element, encoding="utf-8"))
+        return corpus
+
+    def search(self, term):
+        """
+        PMID che soddisfano `term`. Il testo della query viene ignorato (tutto il corpus corrisponde),
+        i filtri [PDAT] invece vengono applicati, così la partizione per date dello scraper big-data funziona.
+        """
+        ranges = [(int("".join(m[:3])), int("".join(m[3:]))) for m in PDAT_RE.findall(term or "")]
+        return [
+            pmid for pmid, (date, _) in self.articles.items()
+            if all(low <= date <= high for low, high in ranges)
+        ]
+
+    def xml(self, pmids):
+        body = b"".join(self.articles[p][1] for p in pmids if p in self.articles)
+        return b'<?xml version="1.0" encoding="UTF-8"?>\n<PubmedArticleSet>' + body + b"</PubmedArticleSet>"
+
+    def __len__(self):
+        return len(self.articles)
+
+
+class Faults:
+    """
+    Comportamento del server: latenza per richiesta, errori 5xx e 429 casuali, rate limit per client.
+    Con lo stesso seed e richieste sequenziali gli errori iniettati sono sempre gli stessi.
+    """
+
+    def __init__(self, latency_ms=0, jitter_ms=0, error_rate=0.0, throttle_rate=0.0, rate_limit=None,
+                 retry_after=1, seed=0):
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.windows = {}  # client → istanti delle richieste nell'ultimo secondo
+
+    def delay(self):
+        with self.lock:
+            jitter = self.rng.uniform(-self.jitter, self.jitter) if self.jitter else 0
+        return max(0.0, self.latency + jitter)
+
+    def injected_status(self, client):
+        """
+        Codice di errore da restituire a questa richiesta (429 o 5xx), oppure None.
+        """
+        with self.lock:
+            if self.rate_limit:
+                # Finestra scorrevole di un secondo, come il limite NCBI di 3 (o 10) richieste/s per IP o API key
+                now = time.monotonic()
+                window = [t for t in self.windows.get(client, ()) if now - t < 1.0]
+                if len(window) >= self.rate_limit:
+                    self.windows[client] = window
+                    return 429
+                window.append(now)
+                self.windows[client] = window
+            roll = self.rng.random()
+        if roll < self.throttle_rate:
+            return 429
+        if roll < self.throttle_rate + self.error_rate:
+            return self.rng.choice((500, 502, 503))
+        return None
+
+
+class MockEUtilsServer:
+    """
+    Server HTTP locale con esearch/efetch compatibili con quelli usati dagli script di scraping:
+    esearch (JSON o XML, usehistory=y con WebEnv/query_key) ed efetch (per lista di ID o dal
+    history server per retstart/retmax, XML oppure rettype=uilist). Le statistiche sono su /stats.
+    """
+
+    def __init__(self, corpus, faults=None, host="127.0.0.1", port=0):
+        self.corpus = corpus
+        self.faults = faults or Faults()
+        self.history = {}  # WebEnv → {query_key: lista di PMID}
+        self.stats = {"requests": {}, "status": {}, "bytes": 0}
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), _make_handler(self))
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}{BASE_PATH}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def record(self, endpoint, status, size):
+        with self.lock:
+            self.stats["requests"][endpoint] = self.stats["requests"].get(endpoint, 0) + 1
+            self.stats["status"][str(status)] = self.stats["status"].get(str(status), 0) + 1
+            self.stats["bytes"] += size
+
+    def snapshot(self):
+        with self.lock:
+            return json.loads(json.dumps(self.stats))
+
+    # --- E-utilities ---
+
+    def esearch(self, params):
+        pmids = self.corpus.search(params.get("term", ""))
+        retstart = int(params.get("retstart", 0))
+        if retstart >= ESEARCH_MAX_RECORDS:
+            error = (f"Search Backend failed: 'retstart' cannot be larger than {ESEARCH_MAX_RECORDS - 1}. "
+                     f"For PubMed, ESearch can only retrieve the first {ESEARCH_MAX_RECORDS} records matching the query.")
+            return 400, "application/json", json.dumps({"esearchresult": {"ERROR": error}}).encode()
+        end = min(retstart + min(int(params.get("retmax", 20)), ESEARCH_MAX_RETMAX), ESEARCH_MAX_RECORDS)
+        result = {
+            "count": str(len(pmids)),
+            "retmax": str(len(pmids[retstart:end])),
+            "retstart": str(retstart),
+            "idlist": pmids[retstart:end],
+        }
+        if params.get("usehistory") == "y":
+            webenv = params.get("WebEnv") or f"MCID_{uuid.uuid4().hex}"
+            with self.lock:
+                queries = self.history.setdefault(webenv, {})
+                query_key = str(len(queries) + 1)
+                queries[query_key] = pmids
+            result.update(webenv=webenv, querykey=query_key)
+
+        if params.get("retmode") == "json":
+            return 200, "application/json", json.dumps({"header": {"type": "esearch"}, "esearchresult": result}).encode()
+        ids = "".join(f"<Id>{pmid}</Id>" for pmid in result["idlist"])
+        history = f"<QueryKey>{result['querykey']}</QueryKey><WebEnv>{result['webenv']}</WebEnv>" if "webenv" in result else ""
+        body = (f"<eSearchResult><Count>{result['count']}</Count><RetMax>{result['retmax']}</RetMax>"
+                f"<RetStart>{retstart}</RetStart>{history}<IdList>{ids}</IdList></eSearchResult>")
+        return 200, "text/xml", body.encode()
+
+    def efetch(self, params):
+        if params.get("id"):
+            pmids = [p.strip() for p in params["id"].split(",") if p.strip()]
+        else:
+            with self.lock:
+                pmids = self.history.get(params.get("WebEnv"), {}).get(params.get("query_key"))
+            if pmids is None:
+                return 400, "text/xml", b"<eFetchResult><ERROR>Unable to obtain query #1</ERROR></eFetchResult>"
+            retstart = int(params.get("retstart", 0))
+            pmids = pmids[retstart:retstart + int(params.get("retmax", 20))]
+
+        if params.get("rettype") == "uilist":
+            return 200, "text/plain", "".join(f"{pmid}\n" for pmid in pmids).encode()
+        return 200, "text/xml", self.corpus.xml(pmids)
+
+
+def _make_handler(server):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, come con NCBI
+
+        def do_GET(self):
+            self._handle(parse_qs(urlparse(self.path).query))
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            self._handle(parse_qs(self.rfile.read(length).decode("utf-8")))
+
+        def _handle(self, query):
+            params = {k: v[-1] for k, v in query.items()}
+            endpoint = urlparse(self.path).path.rsplit("/", 1)[-1].split(".")[0]
+            if endpoint == "stats":
+                return self._send(200, "application/json", json.dumps(server.snapshot()).encode())
+            if endpoint not in ("esearch", "efetch"):
+                return self._send(404, "text/plain", b"Not found")
+
+            time.sleep(server.faults.delay())
+            status = server.faults.injected_status(params.get("api_key") or self.client_address[0])
+            if status == 429:
+                body = json.dumps({"error": "API rate limit exceeded", "count": str(server.faults.rate_limit or "")})
+                headers = {"Retry-After": str(server.faults.retry_after)} if server.faults.retry_after else {}
+                result = (429, "application/json", body.encode(), headers)
+            elif status:
+                result = (status, "text/html", b"<html><body>Server Error</body></html>", {})
+            else:
+                result = (*getattr(server, endpoint)(params), {})
+            server.record(endpoint, result[0], len(result[2]))
+            self._send(*result)
+
+        def _send(self, status, content_type, body, headers=None):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def add_fault_arguments(parser):
+    parser.add_argument("--latency-ms", type=float, default=0, help="Latenza aggiunta a ogni richiesta")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="Variazione casuale (±) della latenza")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Frazione di risposte 500/502/503")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Frazione di risposte 429 casuali")
+    parser.add_argument("--server-rate-limit", type=int, help="Richieste/s per client oltre le quali si risponde 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="Header Retry-After delle risposte 429 (0: assente)")
+
+
+def faults_from_args(args):
+    return Faults(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+                  throttle_rate=args.throttle_rate, rate_limit=args.server_rate_limit,
+                  retry_after=args.retry_after, seed=args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Server E-utilities locale (esearch/efetch) per i test dello scraper")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--articles", type=int, default=10_000, help="Dimensione del corpus sintetico")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--fixtures", nargs="+", help="Risposte efetch registrate da servire al posto del corpus sintetico")
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+
+    corpus = MockCorpus.from_fixtures(args.fixtures) if args.fixtures else MockCorpus.synthetic(args.articles, args.seed)
+    server = MockEUtilsServer(corpus, faults_from_args(args), host=args.host, port=args.port)
+    print(f"🧪 {len(corpus)} articoli su {server.url} (export NCBI_EUTILS_URL={server.url})")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+from dotenv import load_dotenv
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+
+load_dotenv()
+
+SCROLL_PAGE = 1000
+EXACT_CHUNK = 65536  # righe del corpus per prodotto matriciale (limita la memoria di Q·Cᵀ)
+DEFAULT_EFS = [16, 32, 64, 128, 256]
+DEFAULT_OVERSAMPLING = [1.0, 2.0, 4.0]
+
+
+def dense_vector(vector):
+    # Con i vettori sparsi BM25 il vettore denso è quello senza nome ("")
+    return vector[""] if isinstance(vector, dict) else vector
+
+
+def load_vectors(client, collection_name, cache_path=None, max_points=None):
+    """
+    Tutti i vettori densi della collection (matrice float32) e i relativi ID, via scroll.
+    Con `cache_path` il risultato viene salvato in un .npz e riletto alle esecuzioni successive.
+    """
+    if cache_path and os.path.exists(cache_path):
+        data = np.load(cache_path, allow_pickle=True)
+        return data["vectors"], list(data["ids"])
+
+    ids, vectors = [], []
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection_name, limit=SCROLL_PAGE, offset=offset,
+            with_payload=False, with_vectors=True,
+        )
+        for point in points:
+            ids.append(point.id)
+            vectors.append(dense_vector(point.vector))
+        if offset is None or (max_points and len(ids) >= max_points):
+            break
+        print(f" - Letti {len(ids)} vettori", file=sys.stderr)
+
+    matrix = np.asarray(vectors[:max_points] if max_points else vectors, dtype=np.float32)
+    ids = ids[:len(matrix)]
+    if cache_path:
+        np.savez(cache_path, vectors=matrix, ids=np.asarray(ids, dtype=object))
+    return matrix, ids
+
+
+def normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+def exact_top_k(queries, corpus, k, chunk_size=EXACT_CHUNK):
+    """
+    Top-k esatto per similarità coseno: prodotti matriciali a blocchi di `chunk_size` righe del corpus,
+    mantenendo per ogni domanda i k migliori visti finora. Ritorna gli indici (n_query × k) in ordine di score.
+    """
+    queries = normalize(queries)
+    best_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+    best_index = np.zeros((len(queries), k), dtype=np.int64)
+    for start in range(0, len(corpus), chunk_size):
+        block = normalize(corpus[start:start + chunk_size])
+        scores = queries @ block.T
+        kk = min(k, scores.shape[1])
+        top = np.argpartition(-scores, kk - 1, axis=1)[:, :kk]
+        merged_scores = np.concatenate([best_scores, np.take_along_axis(scores, top, axis=1)], axis=1)
+        merged_index = np.concatenate([best_index, top + start], axis=1)
+        keep = np.argpartition(-merged_scores, k - 1, axis=1)[:, :k]
+        best_scores = np.take_along_axis(merged_scores, keep, axis=1)
+        best_index = np.take_along_axis(merged_index, keep, axis=1)
+    order = np.argsort(-best_scores, axis=1)
+    return np.take_along_axis(best_index, order, axis=1)
+
+
+def search_configs(efs, quantized, oversamplings):
+    """
+    Combinazioni di parametri da provare: (nome, SearchParams).
+    """
+    configs = []
+    for ef in efs:
+        if not quantized:
+            configs.append((f"ef={ef}", models.SearchParams(hnsw_ef=ef)))
+            continue
+        configs.append((f"ef={ef} int8", models.SearchParams(
+            hnsw_ef=ef, quantization=models.QuantizationSearchParams(rescore=False))))
+        for oversampling in oversamplings:
+            configs.append((f"ef={ef} int8+rescore x{oversampling:g}", models.SearchParams(
+                hnsw_ef=ef, quantization=models.QuantizationSearchParams(rescore=True, oversampling=oversampling))))
+        configs.append((f"ef={ef} float32", models.SearchParams(
+            hnsw_ef=ef, quantization=models.QuantizationSearchParams(ignore=True))))
+    return configs
+
+
+def evaluate(client, collection_name, queries, truth_ids, k, search_params):
+    latencies, recalls = [], []
+    for query, truth in zip(queries, truth_ids):
+        t0 = time.perf_counter()
+        response = client.query_points(
+            collection_name=collection_name, query=query.tolist(), limit=k,
+            search_params=search_params, with_payload=False,
+        )
+        latencies.append(time.perf_counter() - t0)
+        found = {point.id for point in response.points}
+        recalls.append(len(found & set(truth[:k])) / k)
+    latencies_ms = np.asarray(latencies) * 1000
+    return {
+        f"recall@{k}": round(float(np.mean(recalls)), 4),
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 3),
+        "p99_ms": round(float(np.percentile(latencies_ms, 99)), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall@k di Qdrant rispetto al top-k esatto calcolato con NumPy")
+    parser.add_argument("--qdrant-url", default=os.getenv("QDRANT_URL", "http://localhost:6333"))
+    parser.add_argument("--collection", default="pubmed_articles")
+    parser.add_argument("--vectors-cache", help="File .npz con i vettori già letti (creato se non esiste)")
+    parser.add_argument("--max-points", type=int, help="Usa solo i primi N punti (la ground truth è su questi)")
+    parser.add_argument("--queries", type=int, default=200, help="Domande campionate dai vettori della collection")
+    parser.add_argument("--noise", type=float, default=0.05, help="Rumore gaussiano aggiunto alle domande campionate")
+    parser.add_argument("--k", default="5,10", help="Valori di limit separati da virgola")
+    parser.add_argument("--ef", default=",".join(map(str, DEFAULT_EFS)), help="Valori di hnsw_ef separati da virgola")
+    parser.add_argument("--oversampling", default=",".join(map(str, DEFAULT_OVERSAMPLING)))
+    parser.add_argument("--target-recall", type=float, default=0.95)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="File JSON del report (default: stdout)")
+    args = parser.parse_args()
+
+    client = QdrantClient(url=args.qdrant_url, api_key=os.getenv("QDRANT_API_KEY"))
+    corpus, ids = load_vectors(client, args.collection, cache_path=args.vectors_cache, max_points=args.max_points)
+    print(f"📦 {len(ids)} vettori da '{args.collection}'", file=sys.stderr)
+
+    rng = np.random.default_rng(args.seed)
+    sample = rng.choice(len(corpus), size=min(args.queries, len(corpus)), replace=False)
+    # Domande vicine ma non identiche ai documenti, come domande reali sullo stesso tema
+    queries = corpus[sample] + rng.normal(0, args.noise, size=(len(sample), corpus.shape[1])).astype(np.float32)
+
+    ks = [int(k) for k in args.k.split(",")]
+    t0 = time.perf_counter()
+    truth_index = exact_top_k(queries, corpus, max(ks))
+    truth_ids = [[ids[i] for i in row] for row in truth_index]
+    print(f"🎯 Ground truth esatta in {time.perf_counter() - t0:.2f} s", file=sys.stderr)
+
+    quantized = client.get_collection(args.collection).config.quantization_config is not None
+    configs = search_configs([int(ef) for ef in args.ef.split(",")], quantized,
+                             [float(o) for o in args.oversampling.split(",")])
+
+    results = []
+    for k in ks:
+        for name, params in configs:
+            row = {"k": k, "config": name, **evaluate(client, args.collection, queries, truth_ids, k, params)}
+            results.append(row)
+            print(f"k={k:<3} {name:<32} recall={row[f'recall@{k}']:.4f} p50={row['p50_ms']:.2f} ms p99={row['p99_ms']:.2f} ms",
+                  file=sys.stderr)
+
+    # Configurazione più economica (p50 minore) che raggiunge la recall richiesta, per ogni k
+    recommended = {}
+    for k in ks:
+        ok = [r for r in results if r["k"] == k and r[f"recall@{k}"] >= args.target_recall]
+        recommended[k] = min(ok, key=lambda r: r["p50_ms"])["config"] if ok else None
+
+    report = {"collection": args.collection, "points": len(ids), "queries": len(queries),
+              "target_recall": args.target_recall, "results": results, "recommended": recommended}
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
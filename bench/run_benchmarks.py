@@ -0,0 +1,224 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import types
+import warnings
+import zlib
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.join(BENCH_DIR, "..")
+for path in (REPO_DIR, os.path.join(REPO_DIR, "pubmed_to_qdrant"), os.path.join(REPO_DIR, "search"),
+             os.path.join(REPO_DIR, "scraping"), BENCH_DIR):
+    sys.path.insert(0, path)
+
+from synthetic_corpus import articles_to_xml, generate_corpus  # noqa: E402
+
+EMBEDDING_DIM = 384
+
+
+class HashingEmbedder:
+    """
+    Embedder finto per misurare la pipeline senza il costo del modello: bag-of-words con hashing
+    dei token su 384 dimensioni, normalizzato. Stessa interfaccia minima di SentenceTransformer.
+    """
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def get_sentence_embedding_dimension(self):
+        return EMBEDDING_DIM
+
+    def encode(self, texts, batch_size=32, convert_to_numpy=True, show_progress_bar=False, **kwargs):
+        single = isinstance(texts, str)
+        texts = [texts] if single else texts
+        vectors = np.zeros((len(texts), EMBEDDING_DIM), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for token in text.lower().split():
+                vectors[i, zlib.crc32(token.encode("utf-8")) % EMBEDDING_DIM] += 1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors /= np.where(norms == 0, 1, norms)
+        return vectors[0] if single else vectors
+
+
+class QueryEmbedder:
+    # Adattatore con l'interfaccia LangChain usata da minimal_llm (embed_query/embed_documents)
+    def __init__(self, model):
+        self.model = model
+
+    def embed_query(self, text):
+        return self.model.encode(text).tolist()
+
+    def embed_documents(self, texts):
+        return self.model.encode(list(texts)).tolist()
+
+
+def stage_report(latencies, items, seconds=None):
+    # `seconds`: durata reale dello stadio se le chiamate si sovrappongono (altrimenti somma delle latenze)
+    latencies_ms = np.asarray(latencies) * 1000
+    total = float(np.sum(latencies)) if seconds is None else seconds
+    return {
+        "calls": len(latencies),
+        "items": items,
+        "seconds": round(total, 4),
+        "throughput_per_s": round(items / total, 1) if total else None,
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies_ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(latencies_ms, 99)), 3),
+    }
+
+
+def timed(fn, *args, **kwargs):
+    t0 = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - t0
+
+
+def chunks(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def load_modules(fake_embedder):
+    """
+    Importa ingestion e ricerca. Con `fake_embedder` il modulo sentence_transformers viene sostituito
+    prima dell'import, così pubmed_to_qdrant.py non carica (né scarica) il modello.
+    """
+    if fake_embedder:
+        sys.modules["sentence_transformers"] = types.SimpleNamespace(SentenceTransformer=HashingEmbedder)
+    import pubmed_to_qdrant
+    import minimal_llm
+    return pubmed_to_qdrant, minimal_llm
+
+
+def make_client(args):
+    from qdrant_client import QdrantClient
+    if args.qdrant_url:
+        return QdrantClient(url=args.qdrant_url, api_key=os.getenv("QDRANT_API_KEY"))
+    if args.qdrant_path:
+        return QdrantClient(path=args.qdrant_path)
+    return QdrantClient(location=":memory:")
+
+
+def run(args):
+    from pubmed_parser import parse_pubmed_xml
+    from qdrant_loader import BulkUploader, CollectionProfile, create_collection, finish_bulk_load
+    from common.bm25 import BM25Vocabulary
+
+    ingest, search = load_modules(args.fake_embedder)
+    client = make_client(args)
+    local = not args.qdrant_url
+    ingest.client = client
+    # Collection dedicata: il benchmark la ricrea, non deve toccare quella di produzione
+    ingest.COLLECTION_NAME = search.COLLECTION_NAME = args.collection
+
+    # Configurazione della ricerca indipendente dal .env: niente cache su disco, niente micro-batching
+    search.get_client = lambda: client
+    search.get_embedding_model = lambda: QueryEmbedder(ingest.model)
+    search.EMBEDDING_CACHE_DIR = None
+    search.QUERY_BATCH_WAIT_MS = 0
+    search.BM25_VOCAB = None
+    for getter in (search.get_embedding_cache, search.get_query_batcher, search.get_bm25_vocab):
+        getter.cache_clear()
+
+    stages = {}
+    articles = list(generate_corpus(args.articles, seed=args.seed))
+
+    # 1. Parsing XML efetch
+    xml_batches = [articles_to_xml(batch) for batch in chunks(articles, args.parse_batch)]
+    records, latencies = [], []
+    for xml in xml_batches:
+        parsed, seconds = timed(parse_pubmed_xml, xml)
+        records.extend(parsed)
+        latencies.append(seconds)
+    stages["parse"] = stage_report(latencies, len(records))
+
+    if client.collection_exists(ingest.COLLECTION_NAME):
+        client.delete_collection(ingest.COLLECTION_NAME)
+    profile = CollectionProfile(sparse=args.hybrid)
+    create_collection(client, ingest.COLLECTION_NAME, profile)
+
+    if args.hybrid:
+        ingest.bm25_vocab = BM25Vocabulary.build(ingest.article_text(r) for r in records)
+        search.BM25_VOCAB = os.path.join(tempfile.mkdtemp(prefix="oncodb-bench-"), "bm25_vocab.json")
+        ingest.bm25_vocab.save(search.BM25_VOCAB)
+
+    # 2. Embedding + costruzione dei punti
+    points, latencies = [], []
+    for batch in chunks(records, args.batch_size):
+        batch_points, seconds = timed(ingest.prepare_points, batch, batch_size=args.batch_size)
+        points.extend(batch_points)
+        latencies.append(seconds)
+    stages["embed"] = stage_report(latencies, len(points))
+
+    # 3. Upload con un solo BulkUploader, come run_pipeline: una sola barriera finale wait=True per tutto il caricamento
+    # (un uploader per batch rinvierebbe ogni batch due volte). Latenza per batch: da submit a upsert accettato.
+    # Il client locale non è thread-safe: un solo worker
+    workers = 1 if local else args.upload_workers
+    latencies = []
+    t0 = time.perf_counter()
+    with BulkUploader(client, ingest.COLLECTION_NAME, batch_size=args.upload_batch_size, workers=workers) as uploader:
+        for batch in chunks(points, args.upload_batch_size):
+            submitted = time.perf_counter()
+            uploader.submit(batch, on_done=lambda submitted=submitted: latencies.append(time.perf_counter() - submitted))
+    upload_seconds = time.perf_counter() - t0
+    finish_bulk_load(client, ingest.COLLECTION_NAME, profile)
+    stages["upload"] = stage_report(latencies, len(points), seconds=upload_seconds)
+
+    # 4. Ricerca (con e senza filtro); la LRU delle domande viene svuotata per misurare il percorso completo
+    rng = random.Random(args.seed)
+    questions = [rng.choice(records)["title"] for _ in range(args.queries)]
+    for name, filters in (("search", {}), ("search_filtered", {"date_from": "2010", "date_to": "2020"})):
+        latencies = []
+        for question in questions:
+            search._embed_normalized.cache_clear()
+            _, seconds = timed(search.search_qdrant, question, limit=args.limit, **filters)
+            latencies.append(seconds)
+        stages[name] = stage_report(latencies, len(questions))
+
+    return {
+        "config": vars(args),
+        "environment": {"python": platform.python_version(), "numpy": np.__version__, "platform": platform.platform()},
+        "stages": stages,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark end-to-end offline: parsing, embedding, upload, ricerca")
+    parser.add_argument("--articles", type=int, default=2000, help="Dimensione del corpus sintetico")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--parse-batch", type=int, default=100, help="Articoli per documento XML (come un batch efetch)")
+    parser.add_argument("--batch-size", type=int, default=128, help="Articoli per batch di embedding")
+    parser.add_argument("--upload-batch-size", type=int, default=256)
+    parser.add_argument("--upload-workers", type=int, default=4, help="Solo con --qdrant-url")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=5)
+    parser.add_argument("--hybrid", action="store_true", help="Vettori sparsi BM25 e ricerca ibrida")
+    parser.add_argument("--fake-embedder", action="store_true", help="Embedding a hashing al posto di MiniLM")
+    parser.add_argument("--qdrant-path", help="Qdrant locale su disco invece che in memoria")
+    parser.add_argument("--qdrant-url", help="Qdrant reale (es. http://localhost:6333); la collection viene ricreata")
+    parser.add_argument("--collection", default="bench_pubmed_articles", help="Collection usata (viene ricreata)")
+    parser.add_argument("--output", help="File JSON del report (default: stdout)")
+    args = parser.parse_args()
+
+    warnings.filterwarnings("ignore", module="qdrant_client")
+    # I messaggi di avanzamento degli script vanno su stderr: su stdout resta solo il JSON
+    with contextlib.redirect_stdout(sys.stderr):
+        report = run(args)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+import argparse
+import contextlib
+import importlib.util
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.join(BENCH_DIR, "..")
+SCRAPING_DIR = os.path.join(REPO_DIR, "scraping")
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, SCRAPING_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from common.article_store import iter_articles  # noqa: E402
+from mock_eutils import MockCorpus, MockEUtilsServer, add_fault_arguments, faults_from_args  # noqa: E402
+
+SCRIPTS = {
+    "api": os.path.join(SCRAPING_DIR, "pubmed-scrape-api.py"),
+    "big-data": os.path.join(SCRAPING_DIR, "other_versiones", "pubmed-scrape-api-big-data.py"),
+}
+
+
+def load_script(name):
+    """
+    Importa uno script di scraping (nome con trattini) come modulo. Va chiamata dopo aver impostato
+    NCBI_EUTILS_URL: gli URL di eutils vengono letti all'import.
+    """
+    spec = importlib.util.spec_from_file_location(name.replace("-", "_"), SCRIPTS[name])
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def stage(server, fn, *args, **kwargs):
+    """
+    Esegue una fase dello scraping e ritorna (risultato, report) con durata e richieste viste dal server.
+    """
+    before = server.snapshot()
+    t0 = time.perf_counter()
+    result = fn(*args, **kwargs)
+    seconds = time.perf_counter() - t0
+    after = server.snapshot()
+    status = {code: n - before["status"].get(code, 0) for code, n in after["status"].items()}
+    return result, {
+        "seconds": round(seconds, 3),
+        "requests": {ep: n - before["requests"].get(ep, 0) for ep, n in after["requests"].items()},
+        "status": {code: n for code, n in status.items() if n},
+        "bytes": after["bytes"] - before["bytes"],
+    }
+
+
+def run(args):
+    corpus = MockCorpus.from_fixtures(args.fixtures) if args.fixtures else MockCorpus.synthetic(args.articles, args.seed)
+    with MockEUtilsServer(corpus, faults_from_args(args)) as server:
+        os.environ["NCBI_EUTILS_URL"] = server.url
+        os.environ["NCBI_RETRY_BASE_DELAY"] = str(args.retry_base_delay)
+        script = load_script(args.script)
+        from crawl_journal import CrawlJournal, journal_path
+        from eutils import EUtilsClient, esearch_history, fetch_history_ids
+
+        output = args.scrape_output or os.path.join(tempfile.mkdtemp(prefix="oncodb-scrape-"), "pubmed_articles.jsonl")
+        journal = CrawlJournal(journal_path(output), {"script": args.script, "query": args.query}) if args.journal else None
+        # Journal di una scansione già completa: ripartito da zero, quindi esearch viene rifatto
+        journal_restarted = journal.restarted if journal else None
+        stages = {}
+        with EUtilsClient(None, workers=args.workers, rate=args.rate) as client:
+            details = {"journal": journal}
+            if args.script == "big-data":
+                _, stages["count"] = stage(server, script.get_pubmed_count, args.query, client=client)
+                pmids, stages["ids"] = stage(server, script.fetch_pubmed_ids_over_20000, args.query, args.start_year,
+                                             args.end_year, client=client, use_history=args.use_history, journal=journal)
+            elif journal and journal.pmids_complete():
+                pmids, stages["ids"] = stage(server, journal.pmids)
+            elif args.use_history:
+                history, _ = stage(server, esearch_history, client, args.query)
+                pmids, stages["ids"] = stage(server, fetch_history_ids, client, history, retmax=args.retmax)
+                details.update(history=history, history_batch_size=args.history_batch_size)
+                if journal:
+                    journal.save_pmids(pmids)
+            else:
+                pmids, stages["ids"] = stage(server, script.fetch_pubmed_ids, args.query, retmax=args.retmax,
+                                             client=client, journal=journal)
+
+            total, stages["details"] = stage(server, script.fetch_pubmed_details, pmids, save_path=output,
+                                             client=client, ordered=not args.unordered, **details)
+        batches = journal.summary() if journal else None
+        if journal:
+            journal.close()
+
+        saved = {art["pmid"] for art in iter_articles(output)}
+        for report in stages.values():
+            report["throughput_req_per_s"] = round(sum(report["requests"].values()) / report["seconds"], 1) if report["seconds"] else None
+        stages["details"]["throughput_articles_per_s"] = round(total / stages["details"]["seconds"], 1) if stages["details"]["seconds"] else None
+
+        return {
+            "config": vars(args),
+            "corpus": len(corpus),
+            "pmids": len(pmids),
+            "articles_saved": len(saved),
+            # Articoli persi: batch scartati dopo MAX_RETRIES
+            "articles_missing": len(set(pmids) - saved),
+            "journal_batches": batches,
+            "journal_restarted": journal_restarted,
+            "stages": stages,
+            "server": server.snapshot(),
+            "output": output,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test dello scraper contro il server E-utilities locale")
+    parser.add_argument("--script", choices=sorted(SCRIPTS), default="api")
+    parser.add_argument("--query", default="cancer immunotherapy clinical trial")
+    parser.add_argument("--articles", type=int, default=2000, help="Dimensione del corpus sintetico")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--fixtures", nargs="+", help="Risposte efetch registrate al posto del corpus sintetico")
+    parser.add_argument("--retmax", type=int, default=20000)
+    parser.add_argument("--start-year", type=int, default=1995, help="Solo --script big-data")
+    parser.add_argument("--end-year", type=int, default=2025, help="Solo --script big-data")
+    parser.add_argument("--use-history", action="store_true")
+    parser.add_argument("--history-batch-size", type=int, default=500)
+    parser.add_argument("--unordered", action="store_true")
+    parser.add_argument("--workers", type=int, default=None, help="Richieste efetch in parallelo (default: rate limit)")
+    parser.add_argument("--rate", type=float, default=10, help="Rate limit del client (richieste/s)")
+    parser.add_argument("--retry-base-delay", type=float, default=0.1, help="Base del backoff tra i retry (s)")
+    parser.add_argument("--journal", action="store_true", help="Usa il crawl journal (<file scaricato>.journal)")
+    parser.add_argument("--scrape-output", help="File JSONL scaricato (default: temporaneo); riusarlo con --journal prova la ripresa")
+    add_fault_arguments(parser)
+    parser.add_argument("--output", help="File JSON del report (default: stdout)")
+    args = parser.parse_args()
+
+    # Prima degli script: il loro basicConfig (logs.txt) non ha effetto se il logging è già configurato
+    logging.basicConfig(stream=sys.stderr, level=logging.WARNING, format="%(asctime)s [%(levelname)s] %(message)s")
+    with contextlib.redirect_stdout(sys.stderr):
+        report = run(args)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
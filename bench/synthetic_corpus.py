@@ -0,0 +1,146 @@
+import argparse
+import json
+import random
+from xml.sax.saxutils import escape
+
+# Vocabolario oncologico per testi plausibili (lunghezze e token simili agli abstract reali)
+CANCERS = ["breast cancer", "colorectal cancer", "non-small cell lung cancer", "melanoma", "glioblastoma",
+           "pancreatic adenocarcinoma", "prostate cancer", "ovarian cancer", "hepatocellular carcinoma",
+           "acute myeloid leukemia", "multiple myeloma", "gastric cancer"]
+GENES = ["BRCA1", "BRCA2", "TP53", "KRAS", "EGFR", "HER2", "ALK", "BRAF", "PIK3CA", "PD-L1", "IDH1", "MSI-H"]
+DRUGS = ["pembrolizumab", "nivolumab", "trastuzumab", "osimertinib", "olaparib", "bevacizumab",
+         "5-FU", "cisplatin", "temozolomide", "imatinib", "CAR-T", "sotorasib"]
+OUTCOMES = ["overall survival", "progression-free survival", "objective response rate", "toxicity",
+            "quality of life", "recurrence", "minimal residual disease"]
+FILLER = ["patients", "cohort", "treatment", "significantly", "associated", "analysis", "results", "clinical",
+          "expression", "therapy", "median", "follow-up", "randomized", "observed", "compared", "baseline",
+          "months", "years", "increase", "reduced", "risk", "ratio", "confidence", "interval", "study"]
+JOURNALS = ["The Lancet. Oncology", "Journal of Clinical Oncology", "Nature Medicine", "Cancer Research",
+            "JAMA Oncology", "Annals of Oncology", "Clinical Cancer Research", "Cancers"]
+FIRST_NAMES = ["Maria", "John", "Wei", "Giulia", "Ahmed", "Sofia", "Hiroshi", "Anna", "Luca", "Elena", "David"]
+LAST_NAMES = ["Rossi", "Smith", "Zhang", "Bianchi", "Khan", "Garcia", "Tanaka", "Müller", "Ferrari", "Kim", "Brown"]
+MONTHS = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+SECTIONS = ["BACKGROUND", "METHODS", "RESULTS", "CONCLUSIONS"]
+PUB_TYPES = ["Journal Article", "Randomized Controlled Trial", "Review", "Clinical Trial, Phase III", "Meta-Analysis"]
+
+
+def _sentence(rng):
+    words = rng.sample(FILLER, rng.randint(6, 14))
+    words.insert(rng.randrange(len(words)), rng.choice(GENES))
+    words.insert(rng.randrange(len(words)), rng.choice(DRUGS))
+    words.insert(rng.randrange(len(words)), rng.choice(OUTCOMES))
+    if rng.random() < 0.1:
+        words.append(f"(NCT{rng.randint(0, 99999999):08d})")
+    sentence = " ".join(words)
+    return sentence[0].upper() + sentence[1:] + "."
+
+
+def synthetic_article(pmid, seed=0):
+    """
+    Articolo sintetico con la stessa struttura dei record di scraping/pubmed_parser.py.
+    Deterministico: stesso PMID e seed → stesso articolo.
+    """
+    rng = random.Random(f"{seed}:{pmid}")
+    cancer = rng.choice(CANCERS)
+    title = f"{rng.choice(DRUGS).capitalize()} in {rng.choice(GENES)}-mutated {cancer}: {rng.choice(OUTCOMES)}"
+
+    structured = rng.random() < 0.6
+    sections = []
+    for label in (SECTIONS if structured else [""]):
+        text = " ".join(_sentence(rng) for _ in range(rng.randint(1, 4) if structured else rng.randint(4, 10)))
+        sections.append({"label": label, "text": text})
+
+    year = rng.randint(1995, 2025)
+    date_kind = rng.random()
+    if date_kind < 0.6:
+        date = {"Year": str(year), "Month": rng.choice(MONTHS), "Day": str(rng.randint(1, 28))}
+        pub_date = f"{year}-{date['Month']}-{date['Day']}"
+    elif date_kind < 0.9:
+        date = {"Year": str(year), "Month": rng.choice(MONTHS)}
+        pub_date = f"{year}-{date['Month']}-"
+    else:
+        date = {"MedlineDate": f"{year} {rng.choice(MONTHS)}-{rng.choice(MONTHS)}"}
+        pub_date = date["MedlineDate"]
+
+    return {
+        "pmid": str(pmid),
+        "title": title,
+        "abstract": " ".join(s["text"] for s in sections),
+        "authors": [f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}" for _ in range(rng.randint(1, 8))],
+        "pub_date": pub_date,
+        "journal": rng.choice(JOURNALS),
+        "doi": f"10.{rng.randint(1000, 9999)}/synthetic.{pmid}",
+        "mesh_terms": sorted({cancer.title(), rng.choice(GENES), "Humans"}),
+        "publication_types": [rng.choice(PUB_TYPES)],
+        "abstract_sections": sections,
+        "_date_xml": date,
+    }
+
+
+def generate_corpus(n, seed=0, start_pmid=10_000_000):
+    for pmid in range(start_pmid, start_pmid + n):
+        yield synthetic_article(pmid, seed)
+
+
+def article_xml(art):
+    # Elemento <PubmedArticle> di un articolo sintetico
+    authors = "".join(
+        f"<Author><LastName>{escape(a.split(' ', 1)[1])}</LastName><ForeName>{escape(a.split(' ', 1)[0])}</ForeName></Author>"
+        for a in art["authors"]
+    )
+    abstract = "".join(
+        f'<AbstractText Label="{s["label"]}">{escape(s["text"])}</AbstractText>' if s["label"]
+        else f"<AbstractText>{escape(s['text'])}</AbstractText>"
+        for s in art["abstract_sections"]
+    )
+    date = "".join(f"<{k}>{escape(v)}</{k}>" for k, v in art["_date_xml"].items())
+    mesh = "".join(f"<MeshHeading><DescriptorName>{escape(m)}</DescriptorName></MeshHeading>" for m in art["mesh_terms"])
+    pub_types = "".join(f"<PublicationType>{escape(p)}</PublicationType>" for p in art["publication_types"])
+    return (
+        "<PubmedArticle><MedlineCitation>"
+        f"<PMID>{art['pmid']}</PMID><Article>"
+        f"<Journal><JournalIssue><PubDate>{date}</PubDate></JournalIssue><Title>{escape(art['journal'])}</Title></Journal>"
+        f"<ArticleTitle>{escape(art['title'])}</ArticleTitle>"
+        f"<Abstract>{abstract}</Abstract>"
+        f"<AuthorList>{authors}</AuthorList>"
+        f"<PublicationTypeList>{pub_types}</PublicationTypeList>"
+        "</Article>"
+        f"<MeshHeadingList>{mesh}</MeshHeadingList>"
+        "</MedlineCitation><PubmedData><ArticleIdList>"
+        f'<ArticleId IdType="pubmed">{art["pmid"]}</ArticleId><ArticleId IdType="doi">{escape(art["doi"])}</ArticleId>'
+        "</ArticleIdList></PubmedData></PubmedArticle>"
+    )
+
+
+def articles_to_xml(articles):
+    """
+    Documento efetch (`PubmedArticleSet`) con gli articoli dati, come bytes UTF-8.
+    """
+    body = "".join(article_xml(art) for art in articles)
+    return f'<?xml version="1.0" encoding="UTF-8"?>\n<PubmedArticleSet>{body}</PubmedArticleSet>'.encode("utf-8")
+
+
+def article_record(art):
+    # Record JSON come lo salva lo scraper (senza i campi interni del generatore)
+    return {k: v for k, v in art.items() if not k.startswith("_")}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera un corpus PubMed sintetico (XML efetch + JSONL)")
+    parser.add_argument("--articles", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--xml", default="synthetic_pubmed.xml")
+    parser.add_argument("--jsonl", default="synthetic_pubmed.jsonl")
+    args = parser.parse_args()
+
+    articles = list(generate_corpus(args.articles, seed=args.seed))
+    with open(args.xml, "wb") as f:
+        f.write(articles_to_xml(articles))
+    with open(args.jsonl, "w", encoding="utf-8") as f:
+        for art in articles:
+            f.write(json.dumps(article_record(art), ensure_ascii=False) + "\n")
+    print(f"✅ {len(articles)} articoli sintetici → {args.xml}, {args.jsonl}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+import json
+import os
+
+
+INDEX_SUFFIX = ".pmids"
+COMMIT_MARKER = "@"
+
+
+class ArticleStore:
+    """
+    Archivio append-only di articoli PubMed in formato JSONL (un articolo per riga).
+
+    Accanto al file dati viene mantenuto un indice compatto dei PMID (`<path>.pmids`):
+    per ogni batch vengono scritti i PMID seguiti da una riga `@<dimensione file dati>`
+    che marca il commit. Alla riapertura l'indice viene usato per la ripresa senza
+    rileggere il file dati; se non è coerente (crash a metà batch) viene ricostruito.
+    """
+
+    def __init__(self, path, fsync=True):
+        self.path = path
+        self.index_path = path + INDEX_SUFFIX
+        self.fsync = fsync
+        self.pmids = set()
+
+        _migrate_legacy_json(path)
+        self._truncate_partial_line()
+        if not self._load_index():
+            self._rebuild_index()
+
+        self._data = open(self.path, "a", encoding="utf-8")
+        self._index = open(self.index_path, "a", encoding="utf-8")
+
+    def __contains__(self, pmid):
+        return pmid in self.pmids
+
+    def __len__(self):
+        return len(self.pmids)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def append_batch(self, articles):
+        """
+        Aggiunge un batch di articoli in coda al file e aggiorna l'indice.
+        Gli articoli già presenti (stesso PMID) vengono ignorati.
+        Ritorna il numero di articoli effettivamente scritti.
+        """
+        new_articles = []
+        for art in articles:
+            pmid = art.get("pmid")
+            if pmid and pmid not in self.pmids:
+                new_articles.append(art)
+                self.pmids.add(pmid)
+        if not new_articles:
+            return 0
+
+        lines = "".join(json.dumps(art, ensure_ascii=False) + "\n" for art in new_articles)
+        self._data.write(lines)
+        self._sync(self._data)
+
+        index_lines = "".join(art["pmid"] + "\n" for art in new_articles)
+        self._index.write(f"{index_lines}{COMMIT_MARKER}{self._data.tell()}\n")
+        self._sync(self._index)
+        return len(new_articles)
+
+    def close(self):
+        self._data.close()
+        self._index.close()
+
+    def _sync(self, f):
+        f.flush()
+        if self.fsync:
+            os.fsync(f.fileno())
+
+    def _truncate_partial_line(self):
+        # Un crash durante la scrittura può lasciare l'ultima riga a metà: la scartiamo
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb+") as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            if size == 0:
+                return
+            f.seek(size - 1)
+            if f.read(1) == b"\n":
+                return
+            # Torna indietro fino all'ultimo newline completo
+            pos = size
+            chunk = 4096
+            while pos > 0:
+                start = max(0, pos - chunk)
+                f.seek(start)
+                data = f.read(pos - start)
+                nl = data.rfind(b"\n")
+                if nl != -1:
+                    f.truncate(start + nl + 1)
+                    return
+                pos = start
+            f.truncate(0)
+
+    def _load_index(self):
+        if not os.path.exists(self.index_path):
+            return not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+
+        data_size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        committed_size = 0
+        pmids = set()
+        pending = []
+        with open(self.index_path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.rstrip("\n")
+                if line.startswith(COMMIT_MARKER):
+                    pmids.update(pending)
+                    pending = []
+                    committed_size = int(line[1:])
+                elif line:
+                    pending.append(line)
+
+        if committed_size != data_size:
+            return False
+        self.pmids = pmids
+        return True
+
+    def _rebuild_index(self):
+        pmids = []
+        for art in iter_articles(self.path):
+            if art.get("pmid"):
+                pmids.append(art["pmid"])
+        self.pmids = set(pmids)
+
+        data_size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("".join(p + "\n" for p in pmids))
+            f.write(f"{COMMIT_MARKER}{data_size}\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.index_path)
+
+
+def iter_articles(path):
+    """
+    Legge gli articoli uno alla volta da un file JSONL.
+    Per compatibilità accetta anche il vecchio formato (array JSON unico).
+    """
+    if not os.path.exists(path):
+        return
+
+    if _is_legacy_json(path):
+        with open(path, "r", encoding="utf-8") as f:
+            yield from json.load(f)
+        return
+
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def _is_legacy_json(path):
+    with open(path, "r", encoding="utf-8") as f:
+        while True:
+            ch = f.read(1)
+            if not ch or not ch.isspace():
+                return ch == "["
+
+
+def _migrate_legacy_json(path):
+    # I file prodotti dalle versioni precedenti sono un unico array JSON: li convertiamo una volta in JSONL
+    if not os.path.exists(path) or not _is_legacy_json(path):
+        return
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as out:
+        for art in iter_articles(path):
+            out.write(json.dumps(art, ensure_ascii=False) + "\n")
+        out.flush()
+        os.fsync(out.fileno())
+    os.replace(tmp_path, path)
@@ -0,0 +1,88 @@
+import json
+import os
+import re
+from collections import Counter
+
+SPARSE_VECTOR_NAME = "bm25"
+K1 = 1.2
+B = 0.75
+
+# Token biomedici interi: nomi di geni (BRCA1, HER2), codici di farmaci e trial (NCT01234567), 5-FU, IL-6, ...
+_TOKEN_RE = re.compile(r"[a-z0-9](?:[a-z0-9]|[\-.](?=[a-z0-9]))*")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were which with "
+    "we our these those than been between into not no".split()
+)
+
+
+def tokenize(text):
+    return [t for t in _TOKEN_RE.findall((text or "").lower()) if t not in STOPWORDS]
+
+
+class BM25Vocabulary:
+    """
+    Vocabolario BM25 costruito dal corpus locale: termine → indice della dimensione sparsa,
+    più numero di documenti e lunghezza media usati per la normalizzazione.
+    Il peso IDF non è nei vettori dei documenti ma viene applicato da Qdrant (modifier IDF
+    della sparse vector), così resta corretto anche dopo caricamenti incrementali.
+    """
+
+    def __init__(self, terms=None, doc_count=0, total_length=0):
+        self.terms = terms or {}
+        self.doc_count = doc_count
+        self.total_length = total_length
+
+    @property
+    def avg_length(self):
+        return self.total_length / self.doc_count if self.doc_count else 1.0
+
+    @classmethod
+    def build(cls, texts, previous=None):
+        """
+        Costruisce il vocabolario da uno stream di testi. Con `previous` gli indici dei termini già
+        noti restano invariati (i vettori già caricati restano validi) e i nuovi termini vengono accodati.
+        """
+        vocab = cls(terms=dict(previous.terms) if previous else {})
+        for text in texts:
+            tokens = tokenize(text)
+            vocab.doc_count += 1
+            vocab.total_length += len(tokens)
+            for token in tokens:
+                if token not in vocab.terms:
+                    vocab.terms[token] = len(vocab.terms)
+        return vocab
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(terms=data["terms"], doc_count=data["doc_count"], total_length=data["total_length"])
+
+    def save(self, path):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"doc_count": self.doc_count, "total_length": self.total_length, "terms": self.terms},
+                      f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def document_vector(self, text):
+        """
+        Vettore sparso di un documento: per ogni termine la componente di saturazione BM25
+        tf·(k1+1) / (tf + k1·(1 − b + b·dl/avgdl)). Ritorna (indici, valori).
+        """
+        tokens = tokenize(text)
+        norm = K1 * (1 - B + B * len(tokens) / self.avg_length)
+        indices, values = [], []
+        for token, tf in Counter(tokens).items():
+            index = self.terms.get(token)
+            if index is not None:
+                indices.append(index)
+                values.append(tf * (K1 + 1) / (tf + norm))
+        return indices, values
+
+    def query_vector(self, text):
+        """
+        Vettore sparso di una domanda: peso 1 per ogni termine noto (l'IDF lo aggiunge Qdrant).
+        """
+        indices = sorted({self.terms[t] for t in tokenize(text) if t in self.terms})
+        return indices, [1.0] * len(indices)
@@ -0,0 +1,213 @@
+import hashlib
+import json
+import mmap
+import os
+import threading
+
+import numpy as np
+
+DATA_FILE = "docs.bin"
+INDEX_FILE = "docs.idx.npy"
+LOG_FILE = "docs.idx.log"  # voci d'indice non ancora fuse in INDEX_FILE
+COMPACT_MARKER = "compact.pending"
+COMPACT_RATIO = 2.0  # compatta quando il file dati supera di questo fattore i record correnti
+INDEX_DTYPE = np.dtype([("key", "<u8"), ("offset", "<u8"), ("length", "<u4")])
+
+
+def doc_key(pmid):
+    """
+    Chiave numerica a 64 bit di un PMID (il PMID stesso se numerico, altrimenti un hash stabile).
+    """
+    try:
+        return int(pmid)
+    except (ValueError, TypeError):
+        return int.from_bytes(hashlib.blake2b(str(pmid).encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class DocStoreWriter:
+    """
+    Scrive i testi degli articoli in un unico file (`docs.bin`, record JSON concatenati) e un indice
+    ordinato PMID → (offset, lunghezza) (`docs.idx.npy`). I nuovi record vengono accodati:
+    se un PMID viene riscritto vale l'ultima versione.
+
+    `flush()` rende durevoli i record scritti finora: dati e nuove voci d'indice (accodate a `docs.idx.log`)
+    vanno su disco con fsync. Alla chiusura, o alla riapertura dopo un crash, il log viene fuso nell'indice.
+    Se i record superati occupano più della metà del file, alla chiusura il file dati viene compattato.
+    """
+
+    def __init__(self, directory, compact_ratio=COMPACT_RATIO):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.compact_ratio = compact_ratio
+        self.lock = threading.Lock()
+        _finish_compaction(directory)
+        # Voci d'indice rimaste nel log da un'esecuzione interrotta
+        _merge_log(directory)
+        self.data = open(os.path.join(directory, DATA_FILE), "ab")
+        self.log = open(os.path.join(directory, LOG_FILE), "ab")
+        self.offset = self.data.tell()
+        self.entries = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def add(self, pmid, doc):
+        data = json.dumps(doc, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        with self.lock:
+            self.data.write(data)
+            self.entries.append((doc_key(pmid), self.offset, len(data)))
+            self.offset += len(data)
+
+    def flush(self):
+        """
+        Porta su disco i record aggiunti finora (prima i dati, poi le voci d'indice che li puntano).
+        """
+        with self.lock:
+            if not self.entries:
+                return
+            self.data.flush()
+            os.fsync(self.data.fileno())
+            self.log.write(np.array(self.entries, dtype=INDEX_DTYPE).tobytes())
+            self.log.flush()
+            os.fsync(self.log.fileno())
+            self.entries = []
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            self.data.close()
+            self.log.close()
+        index = _merge_log(self.directory)
+        size = os.path.getsize(os.path.join(self.directory, DATA_FILE))
+        live = int(index["length"].sum()) if len(index) else 0
+        if size > self.compact_ratio * live:
+            compact(self.directory)
+
+
+def _load_index(directory):
+    index_path = os.path.join(directory, INDEX_FILE)
+    if os.path.exists(index_path):
+        return np.load(index_path)
+    return np.zeros(0, dtype=INDEX_DTYPE)
+
+
+def _read_log(directory):
+    log_path = os.path.join(directory, LOG_FILE)
+    if not os.path.exists(log_path):
+        return np.zeros(0, dtype=INDEX_DTYPE)
+    with open(log_path, "rb") as f:
+        raw = f.read()
+    # Un crash durante la scrittura può lasciare l'ultima voce a metà: la scartiamo
+    raw = raw[:len(raw) - len(raw) % INDEX_DTYPE.itemsize]
+    return np.frombuffer(raw, dtype=INDEX_DTYPE)
+
+
+def _dedup(entries):
+    # A parità di chiave tiene il record più recente (offset maggiore)
+    entries = entries[np.lexsort((-entries["offset"].astype(np.int64), entries["key"]))]
+    keep = np.ones(len(entries), dtype=bool)
+    keep[1:] = entries["key"][1:] != entries["key"][:-1]
+    return entries[keep]
+
+
+def _save_index(directory, index):
+    tmp_path = os.path.join(directory, "docs.idx.tmp.npy")
+    np.save(tmp_path, index)
+    os.replace(tmp_path, os.path.join(directory, INDEX_FILE))
+
+
+def _merge_log(directory):
+    """
+    Fonde le voci del log nell'indice ordinato e svuota il log. Ritorna l'indice risultante.
+    """
+    log = _read_log(directory)
+    index = _load_index(directory)
+    if len(log):
+        index = _dedup(np.concatenate([index, log]))
+        _save_index(directory, index)
+    log_path = os.path.join(directory, LOG_FILE)
+    if os.path.exists(log_path):
+        os.remove(log_path)
+    return index
+
+
+def compact(directory):
+    """
+    Riscrive `docs.bin` con i soli record correnti (in ordine di PMID) e aggiorna l'indice.
+    I file nuovi vengono scritti a parte; il marker `compact.pending` permette di completare
+    la sostituzione alla riapertura se il processo si interrompe a metà.
+    """
+    index = _merge_log(directory)
+    data_path = os.path.join(directory, DATA_FILE)
+    tmp_data, tmp_index = data_path + ".compact", os.path.join(directory, "docs.idx.compact.npy")
+
+    new_index = index.copy()
+    offset = 0
+    with open(data_path, "rb") as src, open(tmp_data, "wb") as dst:
+        for i, (_, old_offset, length) in enumerate(index):
+            src.seek(int(old_offset))
+            dst.write(src.read(int(length)))
+            new_index["offset"][i] = offset
+            offset += int(length)
+        dst.flush()
+        os.fsync(dst.fileno())
+    np.save(tmp_index, new_index)
+
+    with open(os.path.join(directory, COMPACT_MARKER), "w") as f:
+        f.flush()
+        os.fsync(f.fileno())
+    _finish_compaction(directory)
+
+
+def _finish_compaction(directory):
+    # Completa (o ripete) la sostituzione dei file compattati: ogni passo è idempotente
+    if not os.path.exists(os.path.join(directory, COMPACT_MARKER)):
+        return
+    data_path = os.path.join(directory, DATA_FILE)
+    tmp_data, tmp_index = data_path + ".compact", os.path.join(directory, "docs.idx.compact.npy")
+    if os.path.exists(tmp_data):
+        os.replace(tmp_data, data_path)
+    if os.path.exists(tmp_index):
+        os.replace(tmp_index, os.path.join(directory, INDEX_FILE))
+    os.remove(os.path.join(directory, COMPACT_MARKER))
+
+
+class DocStore:
+    """
+    Lettura di sola lettura del docstore: file dati e indice sono memory-mapped, una lettura
+    costa una ricerca binaria sull'indice e la decodifica del solo record richiesto.
+    """
+
+    def __init__(self, directory):
+        index_path = os.path.join(directory, INDEX_FILE)
+        self.index = np.load(index_path, mmap_mode="r") if os.path.exists(index_path) else np.zeros(0, dtype=INDEX_DTYPE)
+        log = _read_log(directory)
+        if len(log):
+            # Ingestion in corso: le voci già rese durevoli ma non ancora fuse nell'indice
+            self.index = _dedup(np.concatenate([self.index, log]))
+        self._file = open(os.path.join(directory, DATA_FILE), "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self.data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def __len__(self):
+        return len(self.index)
+
+    def get(self, pmid):
+        key = doc_key(pmid)
+        keys = self.index["key"]
+        i = int(np.searchsorted(keys, key))
+        if i >= len(keys) or keys[i] != key:
+            return None
+        offset, length = int(self.index["offset"][i]), int(self.index["length"][i])
+        return json.loads(self.data[offset:offset + length])
+
+    def get_many(self, pmids):
+        return {pmid: self.get(pmid) for pmid in pmids}
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self._file.close()
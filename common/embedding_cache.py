@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+
+import numpy as np
+
+DEFAULT_CAPACITY = 500_000  # ~730 MB per vettori da 384 dimensioni
+LOOKUP_CHUNK = 500
+EVICT_FRACTION = 0.05  # quota di voci meno usate liberate quando la cache è piena
+
+
+class EmbeddingCache:
+    """
+    Cache persistente degli embedding, condivisa da ingestion e ricerca.
+
+    I vettori stanno in una matrice float32 memory-mapped (`vectors.f32`, una riga per slot);
+    l'indice SQLite (`index.sqlite`) associa la chiave sha1(modello + testo) allo slot e all'ultimo
+    utilizzo. Oltre `capacity` voci vengono riusati gli slot usati meno di recente.
+    """
+
+    def __init__(self, directory, model_name, dim, capacity=DEFAULT_CAPACITY):
+        os.makedirs(directory, exist_ok=True)
+        self.model_name = model_name
+        self.dim = dim
+        self.lock = threading.Lock()
+
+        meta_path = os.path.join(directory, "meta.json")
+        vectors_path = os.path.join(directory, "vectors.f32")
+        index_path = os.path.join(directory, "index.sqlite")
+
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta["dim"] != dim:
+                raise ValueError(f"Embedding cache in {directory} has dim {meta['dim']}, expected {dim}")
+            # La capacità è fissata alla creazione: la matrice su disco ha già quella dimensione
+            capacity = meta["capacity"]
+        else:
+            with open(meta_path, "w", encoding="utf-8") as f:
+                json.dump({"dim": dim, "capacity": capacity}, f)
+        self.capacity = capacity
+
+        mode = "r+" if os.path.exists(vectors_path) else "w+"
+        self.vectors = np.memmap(vectors_path, dtype=np.float32, mode=mode, shape=(capacity, dim))
+
+        # isolation_level=None: transazioni gestite a mano (BEGIN IMMEDIATE) per l'allocazione degli slot
+        self.conn = sqlite3.connect(index_path, check_same_thread=False, isolation_level=None, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries (key BLOB PRIMARY KEY, slot INTEGER UNIQUE NOT NULL, last_used INTEGER NOT NULL)"
+        )
+        self.conn.execute("CREATE TABLE IF NOT EXISTS free_slots (slot INTEGER PRIMARY KEY)")
+        self.clock = self.conn.execute("SELECT COALESCE(MAX(last_used), 0) FROM entries").fetchone()[0]
+
+    def key(self, text):
+        return hashlib.sha1(f"{self.model_name}\0{text}".encode("utf-8")).digest()
+
+    def get_many(self, texts):
+        """
+        Ritorna (matrice float32 con una riga per testo, indici dei testi non in cache).
+        Le righe dei testi mancanti sono a zero.
+        """
+        keys = [self.key(t) for t in texts]
+        result = np.zeros((len(texts), self.dim), dtype=np.float32)
+        slots = {}
+        missing = []
+        with self.lock:
+            # Lookup, aggiornamento di last_used e lettura dei vettori nella stessa transazione: un put_many
+            # concorrente (anche di un altro processo) non può riassegnare uno slot tra la lookup e la lettura
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                for i in range(0, len(keys), LOOKUP_CHUNK):
+                    chunk = keys[i:i + LOOKUP_CHUNK]
+                    placeholders = ",".join("?" * len(chunk))
+                    rows = self.conn.execute(f"SELECT key, slot FROM entries WHERE key IN ({placeholders})", chunk)
+                    slots.update(rows)
+                if slots:
+                    self.clock += 1
+                    self.conn.executemany(
+                        "UPDATE entries SET last_used = ? WHERE key = ?", [(self.clock, k) for k in slots]
+                    )
+                for i, k in enumerate(keys):
+                    slot = slots.get(k)
+                    if slot is None:
+                        missing.append(i)
+                    else:
+                        result[i] = self.vectors[slot]
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return result, missing
+
+    def put_many(self, texts, vectors):
+        keys = list(dict.fromkeys(self.key(t) for t in texts))
+        by_key = {self.key(t): v for t, v in zip(texts, vectors)}
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.clock += 1
+                for k in keys:
+                    row = self.conn.execute("SELECT slot FROM entries WHERE key = ?", (k,)).fetchone()
+                    slot = row[0] if row else self._allocate_slot()
+                    self.vectors[slot] = by_key[k]
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO entries (key, slot, last_used) VALUES (?, ?, ?)", (k, slot, self.clock)
+                    )
+                self.vectors.flush()
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def _allocate_slot(self):
+        row = self.conn.execute("SELECT slot FROM free_slots LIMIT 1").fetchone()
+        if row is None:
+            next_slot = self.conn.execute("SELECT COALESCE(MAX(slot) + 1, 0) FROM entries").fetchone()[0]
+            if next_slot < self.capacity:
+                return next_slot
+            # Cache piena: libera in blocco le voci usate meno di recente
+            n = max(1, int(self.capacity * EVICT_FRACTION))
+            victims = self.conn.execute("SELECT key, slot FROM entries ORDER BY last_used LIMIT ?", (n,)).fetchall()
+            self.conn.executemany("DELETE FROM entries WHERE key = ?", [(k,) for k, _ in victims])
+            self.conn.executemany("INSERT INTO free_slots (slot) VALUES (?)", [(slot,) for _, slot in victims])
+            row = (victims[0][1],)
+        self.conn.execute("DELETE FROM free_slots WHERE slot = ?", row)
+        return row[0]
+
+    def close(self):
+        with self.lock:
+            self.vectors.flush()
+            self.conn.close()
@@ -0,0 +1,420 @@
+import json
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+from qdrant_client.http import models
+
+from common.docstore import DocStore, DocStoreWriter
+
+SEARCH_BLOCK = 65536  # righe per prodotto matriciale
+INITIAL_CAPACITY = 1024
+ROWS_LOG = "rows.log"  # righe scritte dopo l'ultimo flush(): id e campi filtrabili, una riga JSON per punto
+INT8_SCALE = 127.0
+DEFAULT_NPROBE = 8
+
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+class LocalVectorStore:
+    """
+    Backend vettoriale locale, senza server: alternativa a Qdrant per laptop, CI e corpora piccoli.
+
+    Espone il sottoinsieme dell'interfaccia di QdrantClient usato dagli script (`upsert`, `query_points`,
+    `get_collection`), quindi funziona con BulkUploader, `upload_to_qdrant` e `search_qdrant`.
+    I vettori (normalizzati, similarità coseno) stanno in una matrice memory-mapped float32 o int8;
+    la ricerca è esatta con prodotti matriciali a blocchi, oppure limitata alle liste IVF più vicine
+    dopo `build_ivf`. I campi filtrabili (date, rivista, autori) sono colonne NumPy separate,
+    i payload completi stanno in un docstore (`common/docstore.py`). Solo vettori densi: niente BM25.
+
+    Ogni `upsert` è durevole quando ritorna: vettori e payload vanno su disco e id e colonne dei punti
+    vengono accodati a `rows.log`, riletto alla riapertura. `flush()` riscrive gli snapshot
+    (ids.json, columns.npz, meta.json) e svuota il log, ma solo nell'istanza che ha scritto: un processo
+    di sola ricerca tiene in memoria le righe rilette dal log e non tocca i file, anche mentre
+    un'ingestione è in corso.
+    """
+
+    def __init__(self, directory, dim=384, quantize=False):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.lock = threading.Lock()
+        meta_path = os.path.join(directory, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            with open(os.path.join(directory, "ids.json"), "r", encoding="utf-8") as f:
+                self.ids = json.load(f)
+            with open(os.path.join(directory, "columns_vocab.json"), "r", encoding="utf-8") as f:
+                columns = json.load(f)
+            data = np.load(os.path.join(directory, "columns.npz"))
+            codes, offsets = data["author_codes"], data["author_offsets"]
+            columns["pub_date_int"] = data["pub_date_int"].tolist()
+            columns["journal"] = data["journal"].tolist()
+            columns["authors"] = [codes[offsets[i]:offsets[i + 1]].tolist() for i in range(len(offsets) - 1)]
+        else:
+            meta = {"dim": dim, "quantize": quantize, "capacity": INITIAL_CAPACITY, "updated_at": None}
+            self.ids = []
+            columns = {"pub_date_int": [], "journal": [], "authors": [], "journals": [], "author_names": []}
+
+        self.dim = meta["dim"]
+        self.quantize = meta["quantize"]
+        self.capacity = meta["capacity"]
+        self.updated_at = meta["updated_at"]
+        self.row_of = {point_id: row for row, point_id in enumerate(self.ids)}
+
+        # Colonne dei campi filtrabili; rivista e autori come codici interi su un vocabolario
+        self.pub_date_int = columns["pub_date_int"]
+        self.journal = columns["journal"]
+        self.authors = columns["authors"]
+        self.journals = columns["journals"]
+        self.author_names = columns["author_names"]
+        self.journal_code = {name: i for i, name in enumerate(self.journals)}
+        self.author_code = {name: i for i, name in enumerate(self.author_names)}
+        # Righe riscritte dopo l'assegnazione alle liste IVF: vanno riassegnate
+        self._stale_rows = set()
+        # Righe scritte dopo l'ultimo snapshot (ingestione interrotta o in corso in un altro processo)
+        self._replay_log()
+        while len(self.ids) > self.capacity:
+            self.capacity *= 2
+
+        self.vectors_path = os.path.join(directory, "vectors.i8" if self.quantize else "vectors.f32")
+        self.vectors = self._map_vectors(self.capacity)
+
+        self.ivf = None
+        ivf_path = os.path.join(directory, "ivf.npz")
+        if os.path.exists(ivf_path):
+            data = np.load(ivf_path)
+            self.ivf = {"centroids": data["centroids"], "assign": data["assign"]}
+
+        self.writer = None
+        self.reader = None
+        self._arrays = None
+        self._dirty = False
+        if not os.path.exists(meta_path):
+            # Store nuovo: dimensione e quantizzazione su disco prima del primo upsert
+            self._dirty = True
+            self.flush()
+
+    def _map_vectors(self, capacity):
+        dtype = np.int8 if self.quantize else np.float32
+        size = capacity * self.dim * np.dtype(dtype).itemsize
+        with open(self.vectors_path, "ab") as f:
+            if f.tell() < size:
+                f.truncate(size)
+        return np.memmap(self.vectors_path, dtype=dtype, mode="r+", shape=(capacity, self.dim))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    # --- Interfaccia compatibile con QdrantClient ---
+
+    def upsert(self, collection_name=None, points=(), wait=True, **kwargs):
+        with self.lock:
+            if self.writer is None:
+                self.writer = DocStoreWriter(os.path.join(self.directory, "payloads"))
+                self._truncate_log()
+            log_lines = []
+            for point in points:
+                vector = point.vector[""] if isinstance(point.vector, dict) else point.vector
+                payload = point.payload or {}
+                if point.id in self.row_of:
+                    self._stale_rows.add(self.row_of[point.id])
+                row = self._add_row(point.id)
+                if len(self.ids) > self.capacity:
+                    self.vectors.flush()
+                    self.capacity *= 2
+                    self.vectors = self._map_vectors(self.capacity)
+                self.vectors[row] = self._encode(np.asarray(vector, dtype=np.float32))
+                self._set_columns(row, payload)
+                self.writer.add(row, payload)
+                columns = {key: payload.get(key) for key in ("pub_date_int", "journal", "authors")}
+                log_lines.append(json.dumps({"id": point.id, **columns}, ensure_ascii=False))
+            # Prima vettori e payload, poi il log delle righe che li rende visibili alla riapertura
+            self.vectors.flush()
+            self.writer.flush()
+            with open(os.path.join(self.directory, ROWS_LOG), "a", encoding="utf-8") as f:
+                f.write("".join(line + "\n" for line in log_lines))
+                f.flush()
+                os.fsync(f.fileno())
+            if self.reader is not None:
+                self.reader.close()
+                self.reader = None
+            self._arrays = None
+            self._dirty = True
+
+    def query_points(self, collection_name=None, query=None, query_filter=None, limit=10, with_payload=True,
+                     nprobe=DEFAULT_NPROBE, **kwargs):
+        if self._dirty:
+            self.flush()
+        else:
+            with self.lock:
+                self._refresh_ivf()
+        query_vector = _normalize(np.asarray(query, dtype=np.float32))
+        rows = self._candidate_rows(query_vector, query_filter, nprobe)
+        scores, top_rows = self._top_k(query_vector, rows, limit)
+        points = [
+            models.ScoredPoint(id=self.ids[row], version=0, score=float(score),
+                               payload=self._payload(row) if with_payload else None)
+            for score, row in zip(scores, top_rows)
+        ]
+        return models.QueryResponse(points=points)
+
+    def get_collection(self, collection_name=None):
+        # Quanto basta per il fingerprint della cache delle risposte (search/minimal_llm.py)
+        return SimpleNamespace(points_count=len(self.ids), config=SimpleNamespace(metadata={"updated_at": self.updated_at}))
+
+    # --- Scrittura ---
+
+    def _encode(self, vector):
+        vector = _normalize(vector)
+        if self.quantize:
+            return np.clip(np.round(vector * INT8_SCALE), -127, 127).astype(np.int8)
+        return vector
+
+    def _add_row(self, point_id):
+        row = self.row_of.get(point_id)
+        if row is None:
+            row = len(self.ids)
+            self.ids.append(point_id)
+            self.row_of[point_id] = row
+            self.pub_date_int.append(0)
+            self.journal.append(-1)
+            self.authors.append([])
+        return row
+
+    def _replay_log(self):
+        """
+        Riapplica le righe di `rows.log` sopra lo snapshot. Idempotente: un punto già presente
+        mantiene la sua riga. Ritorna il numero di righe lette.
+        """
+        path = os.path.join(self.directory, ROWS_LOG)
+        if not os.path.exists(path):
+            return 0
+        with open(path, "rb") as f:
+            raw = f.read()
+        # Un'ultima riga senza newline (crash, o scrittura in corso in un altro processo) viene ignorata
+        lines = raw[:raw.rfind(b"\n") + 1].decode("utf-8").splitlines()
+        for line in lines:
+            entry = json.loads(line)
+            point_id = entry.pop("id")
+            if point_id in self.row_of:
+                self._stale_rows.add(self.row_of[point_id])
+            self._set_columns(self._add_row(point_id), entry)
+        return len(lines)
+
+    def _truncate_log(self):
+        # Prima scrittura di questa istanza: scarta l'eventuale riga a metà lasciata da un crash
+        path = os.path.join(self.directory, ROWS_LOG)
+        if not os.path.exists(path):
+            return
+        with open(path, "r+b") as f:
+            raw = f.read()
+            f.truncate(raw.rfind(b"\n") + 1)
+
+    def _set_columns(self, row, payload):
+        self.pub_date_int[row] = int(payload.get("pub_date_int") or 0)
+        journal = payload.get("journal") or ""
+        if journal and journal not in self.journal_code:
+            self.journal_code[journal] = len(self.journals)
+            self.journals.append(journal)
+        self.journal[row] = self.journal_code.get(journal, -1)
+        codes = []
+        for name in payload.get("authors") or []:
+            if name not in self.author_code:
+                self.author_code[name] = len(self.author_names)
+                self.author_names.append(name)
+            codes.append(self.author_code[name])
+        self.authors[row] = codes
+
+    def flush(self):
+        with self.lock:
+            if not self._dirty:
+                return
+            self.vectors.flush()
+            if self.writer is not None:
+                self.writer.close()
+                self.writer = None
+            if self.reader is not None:
+                self.reader.close()
+                self.reader = None
+            if self._refresh_ivf():
+                self._save_ivf()
+            self.updated_at = time.time()
+            self._write_json("ids.json", self.ids)
+            arrays = self._column_arrays()
+            np.savez(os.path.join(self.directory, "columns.npz"), pub_date_int=arrays["pub_date_int"],
+                     journal=arrays["journal"], author_codes=arrays["author_codes"],
+                     author_offsets=arrays["author_offsets"])
+            self._write_json("columns_vocab.json", {"journals": self.journals, "author_names": self.author_names})
+            self._write_json("meta.json", {"dim": self.dim, "quantize": self.quantize, "capacity": self.capacity,
+                                           "updated_at": self.updated_at})
+            # Snapshot completo: le righe del log sono ora in ids.json e columns.npz
+            log_path = os.path.join(self.directory, ROWS_LOG)
+            if os.path.exists(log_path):
+                os.remove(log_path)
+            self._dirty = False
+
+    def close(self):
+        self.flush()
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
+
+    def _write_json(self, name, data):
+        path = os.path.join(self.directory, name)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(path + ".tmp", path)
+
+    # --- IVF ---
+
+    def build_ivf(self, n_lists=None, iterations=10, sample_size=100_000, seed=0):
+        """
+        Partizionamento grossolano IVF: k-means sferico su un campione dei vettori, poi ogni vettore
+        viene assegnato al centroide più vicino. La ricerca visita solo le `nprobe` liste più vicine.
+        """
+        self.flush()
+        n = len(self.ids)
+        n_lists = n_lists or max(1, int(np.sqrt(n)))
+        rng = np.random.default_rng(seed)
+        sample = self._rows(np.sort(rng.choice(n, size=min(sample_size, n), replace=False)))
+        centroids = sample[rng.choice(len(sample), size=min(n_lists, len(sample)), replace=False)].copy()
+        for _ in range(iterations):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(len(centroids)):
+                members = sample[assign == c]
+                # Lista vuota: si riparte da un punto a caso del campione
+                centroids[c] = members.sum(axis=0) if len(members) else sample[rng.integers(len(sample))]
+            centroids = _normalize(centroids)
+        self.ivf = {"centroids": centroids.astype(np.float32), "assign": None}
+        self.ivf["assign"] = self._assign(0, n)
+        self._save_ivf()
+
+    def _assign(self, start, end):
+        parts = [np.argmax(self._rows(np.arange(i, min(i + SEARCH_BLOCK, end))) @ self.ivf["centroids"].T, axis=1)
+                 for i in range(start, end, SEARCH_BLOCK)]
+        return np.concatenate(parts).astype(np.int32) if parts else np.zeros(0, dtype=np.int32)
+
+    def _refresh_ivf(self):
+        """
+        Assegna al centroide più vicino le righe aggiunte o riscritte (es. `--incremental`) dopo l'ultima
+        assegnazione. Solo in memoria: `flush()` la salva. Ritorna True se qualcosa è cambiato.
+        """
+        if self.ivf is None:
+            self._stale_rows.clear()
+            return False
+        assign = self.ivf["assign"]
+        stale = np.fromiter((row for row in self._stale_rows if row < len(assign)), dtype=np.int64)
+        self._stale_rows.clear()
+        if not len(stale) and len(assign) == len(self.ids):
+            return False
+        assign = assign.copy()
+        for i in range(0, len(stale), SEARCH_BLOCK):
+            rows = np.sort(stale[i:i + SEARCH_BLOCK])
+            assign[rows] = np.argmax(self._rows(rows) @ self.ivf["centroids"].T, axis=1)
+        if len(assign) < len(self.ids):
+            assign = np.concatenate([assign, self._assign(len(assign), len(self.ids))])
+        self.ivf["assign"] = assign
+        return True
+
+    def _save_ivf(self):
+        np.savez(os.path.join(self.directory, "ivf.npz"), centroids=self.ivf["centroids"], assign=self.ivf["assign"])
+
+    # --- Ricerca ---
+
+    def _rows(self, rows):
+        block = np.asarray(self.vectors[rows], dtype=np.float32)
+        return block / INT8_SCALE if self.quantize else block
+
+    def _column_arrays(self):
+        if self._arrays is None:
+            lengths = np.fromiter((len(a) for a in self.authors), dtype=np.int64, count=len(self.authors))
+            self._arrays = {
+                "pub_date_int": np.asarray(self.pub_date_int, dtype=np.int64),
+                "journal": np.asarray(self.journal, dtype=np.int64),
+                "author_codes": np.fromiter((c for a in self.authors for c in a), dtype=np.int64, count=int(lengths.sum())),
+                "author_rows": np.repeat(np.arange(len(self.authors)), lengths),
+                "author_offsets": np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64),
+            }
+        return self._arrays
+
+    def _filter_mask(self, query_filter):
+        """
+        Maschera booleana delle righe che soddisfano il filtro. Supporta i filtri di
+        `common/search_filter.py`: range su pub_date_int/pub_year, MatchAny sugli autori, MatchValue sulla rivista.
+        """
+        arrays = self._column_arrays()
+        mask = np.ones(len(self.ids), dtype=bool)
+        if query_filter.should or query_filter.must_not:
+            raise ValueError("Local vector store supports only 'must' filters")
+        for condition in query_filter.must or []:
+            if condition.range is not None and condition.key in ("pub_date_int", "pub_year"):
+                values = arrays["pub_date_int"]
+                if condition.key == "pub_year":
+                    values = values // 10000
+                r = condition.range
+                if r.gte is not None:
+                    mask &= values >= r.gte
+                if r.gt is not None:
+                    mask &= values > r.gt
+                if r.lte is not None:
+                    mask &= values <= r.lte
+                if r.lt is not None:
+                    mask &= values < r.lt
+            elif condition.key == "authors" and isinstance(condition.match, (models.MatchAny, models.MatchValue)):
+                names = condition.match.any if isinstance(condition.match, models.MatchAny) else [condition.match.value]
+                codes = [self.author_code[n] for n in names if n in self.author_code]
+                matched = np.zeros(len(self.ids), dtype=bool)
+                matched[arrays["author_rows"][np.isin(arrays["author_codes"], codes)]] = True
+                mask &= matched
+            elif condition.key == "journal" and isinstance(condition.match, models.MatchValue):
+                mask &= arrays["journal"] == self.journal_code.get(condition.match.value, -2)
+            else:
+                raise ValueError(f"Unsupported filter condition on '{condition.key}'")
+        return mask
+
+    def _candidate_rows(self, query_vector, query_filter, nprobe):
+        # None = tutte le righe (scansione a blocchi contigui, la più veloce)
+        mask = self._filter_mask(query_filter) if query_filter is not None else None
+        if self.ivf is not None and len(self.ivf["assign"]) == len(self.ids):
+            probes = np.argsort(-(self.ivf["centroids"] @ query_vector))[:nprobe]
+            in_lists = np.isin(self.ivf["assign"], probes)
+            mask = in_lists if mask is None else mask & in_lists
+        return None if mask is None else np.flatnonzero(mask)
+
+    def _top_k(self, query_vector, rows, k):
+        n = len(self.ids) if rows is None else len(rows)
+        best_scores = np.zeros(0, dtype=np.float32)
+        best_rows = np.zeros(0, dtype=np.int64)
+        for start in range(0, n, SEARCH_BLOCK):
+            block_rows = np.arange(start, min(start + SEARCH_BLOCK, n)) if rows is None else rows[start:start + SEARCH_BLOCK]
+            block = self._rows(slice(start, start + len(block_rows)) if rows is None else block_rows)
+            scores = block @ query_vector
+            if len(scores) > k:
+                top = np.argpartition(-scores, k - 1)[:k]
+                scores, block_rows = scores[top], block_rows[top]
+            best_scores = np.concatenate([best_scores, scores])
+            best_rows = np.concatenate([best_rows, block_rows])
+            if len(best_scores) > k:
+                top = np.argpartition(-best_scores, k - 1)[:k]
+                best_scores, best_rows = best_scores[top], best_rows[top]
+        order = np.argsort(-best_scores)
+        return best_scores[order], best_rows[order]
+
+    def _payload(self, row):
+        if self.reader is None:
+            if not os.path.exists(os.path.join(self.directory, "payloads", "docs.bin")):
+                return {}
+            self.reader = DocStore(os.path.join(self.directory, "payloads"))
+        return self.reader.get(row) or {}
@@ -0,0 +1,178 @@
+import atexit
+import functools
+import json
+import os
+import threading
+import time
+
+# Esportazione attivata da METRICS_EXPORT:
+#   prometheus:<file>  → file di testo in formato Prometheus (textfile collector), scritto all'uscita
+#   prometheus         → solo in memoria, letto da prometheus_text() (es. GET /metrics di search_service.py)
+#   jsonl:<file>       → una riga JSON per ogni span, scritta man mano
+# Senza METRICS_EXPORT span, timed e count non fanno nulla (un controllo su una variabile globale).
+PREFIX = "oncodb"
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_enabled = False
+_format = None
+_path = None
+_jsonl = None
+_lock = threading.Lock()
+_timings = {}  # (nome, etichette) → [conteggio, somma, conteggi per bucket]
+_counters = {}  # (nome, etichette) → valore
+
+
+def configure(export=None):
+    """
+    Attiva l'esportazione (`prometheus:<file>`, `prometheus` o `jsonl:<file>`); None o "" la disattiva.
+    """
+    global _enabled, _format, _path, _jsonl
+    if _jsonl is not None:
+        _jsonl.close()
+        _jsonl = None
+    _enabled = False
+    if not export:
+        return
+    fmt, _, path = export.partition(":")
+    if fmt not in ("prometheus", "jsonl") or (fmt == "jsonl" and not path):
+        raise ValueError(f"Invalid METRICS_EXPORT {export!r}: expected prometheus[:<file>] or jsonl:<file>")
+    _format, _path = fmt, path or None
+    if fmt == "jsonl":
+        _jsonl = open(path, "a", encoding="utf-8", buffering=1)
+    _enabled = True
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items())) if labels else ()
+
+
+def observe(name, seconds, **labels):
+    if not _enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        stats = _timings.get(key)
+        if stats is None:
+            stats = _timings[key] = [0, 0.0, [0] * len(BUCKETS)]
+        stats[0] += 1
+        stats[1] += seconds
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                stats[2][i] += 1
+                break
+        if _jsonl is not None:
+            _jsonl.write(json.dumps({"ts": time.time(), "span": name, "seconds": round(seconds, 6), **labels}) + "\n")
+
+
+def count(name, value=1, **labels):
+    if not _enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+class _Span:
+    __slots__ = ("name", "labels", "start")
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        labels = self.labels if exc_type is None else {**self.labels, "error": exc_type.__name__}
+        observe(self.name, time.perf_counter() - self.start, **labels)
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+def span(name, **labels):
+    """
+    Misura la durata di un blocco: `with span("parse"): ...`.
+    """
+    return _Span(name, labels) if _enabled else _NOOP
+
+
+def timed(name=None):
+    """
+    Decoratore: misura ogni chiamata della funzione (span con il nome della funzione se `name` è None).
+    """
+    def decorator(fn):
+        span_name = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            with _Span(span_name, {}):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+def prometheus_text():
+    lines = []
+    with _lock:
+        for name in sorted({n for n, _ in _timings}):
+            metric = f"{PREFIX}_{name}_seconds"
+            lines.append(f"# TYPE {metric} histogram")
+            for (n, labels), (calls, total, buckets) in sorted(_timings.items()):
+                if n != name:
+                    continue
+                cumulative = 0
+                for bound, hits in zip(BUCKETS, buckets):
+                    cumulative += hits
+                    lines.append(f"{metric}_bucket{_format_labels(labels + (('le', bound),))} {cumulative}")
+                lines.append(f"{metric}_bucket{_format_labels(labels + (('le', '+Inf'),))} {calls}")
+                lines.append(f"{metric}_sum{_format_labels(labels)} {total:.6f}")
+                lines.append(f"{metric}_count{_format_labels(labels)} {calls}")
+        for name in sorted({n for n, _ in _counters}):
+            metric = f"{PREFIX}_{name}_total"
+            lines.append(f"# TYPE {metric} counter")
+            for (n, labels), value in sorted(_counters.items()):
+                if n == name:
+                    lines.append(f"{metric}{_format_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def export():
+    """
+    Scrive le metriche: il file Prometheus viene riscritto per intero, per JSONL si aggiunge una riga di riepilogo dei contatori.
+    """
+    if not _enabled:
+        return
+    if _format == "prometheus" and _path:
+        tmp_path = _path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(prometheus_text())
+        os.replace(tmp_path, _path)
+    elif _jsonl is not None and _counters:
+        with _lock:
+            counters = {f"{n}{_format_labels(labels)}": v for (n, labels), v in _counters.items()}
+        _jsonl.write(json.dumps({"ts": time.time(), "counters": counters}) + "\n")
+
+
+configure(os.getenv("METRICS_EXPORT"))
+atexit.register(export)
@@ -0,0 +1,74 @@
+import re
+
+MONTHS = {
+    "jan": 1, "feb": 2, "mar": 3, "apr": 4, "may": 5, "jun": 6,
+    "jul": 7, "aug": 8, "sep": 9, "oct": 10, "nov": 11, "dec": 12,
+}
+# Alcune riviste pubblicano per stagione (MedlineDate "2000 Spring"): si usa il primo mese della stagione
+SEASONS = {"spring": 3, "summer": 6, "fall": 9, "autumn": 9, "winter": 12}
+
+_DATE_RE = re.compile(r"(\d{4})(?:[\s\-/]+([A-Za-z]+|\d{1,2}))?(?:[\s\-/]+(\d{1,2})(?!\d))?")
+
+
+def parse_pub_date(raw):
+    """
+    Scompone una data PubMed (`2023-Mar-15`, `2021--`, `2023-03`, MedlineDate `1998 Dec-1999 Jan`, ...)
+    in (anno, mese, giorno); le parti mancanti valgono 0. Per gli intervalli vale la data iniziale.
+    """
+    match = _DATE_RE.search(raw or "")
+    if match is None:
+        return 0, 0, 0
+    year = int(match.group(1))
+    month_token, day_token = match.group(2), match.group(3)
+
+    month = 0
+    if month_token:
+        if month_token.isdigit():
+            month = int(month_token)
+        else:
+            month = MONTHS.get(month_token[:3].lower()) or SEASONS.get(month_token.lower(), 0)
+    if not 1 <= month <= 12:
+        return year, 0, 0
+    day = int(day_token) if day_token else 0
+    if not 1 <= day <= 31:
+        day = 0
+    return year, month, day
+
+
+def normalize_pub_date(raw):
+    """
+    Data in formato ISO con la sola precisione disponibile: `2023-03-15`, `2023-03`, `2023` oppure "".
+    """
+    year, month, day = parse_pub_date(raw)
+    if not year:
+        return ""
+    if not month:
+        return f"{year:04d}"
+    if not day:
+        return f"{year:04d}-{month:02d}"
+    return f"{year:04d}-{month:02d}-{day:02d}"
+
+
+def pub_date_int(raw):
+    """
+    Data come intero YYYYMMDD (parti mancanti a 00), confrontabile con un filtro di range. 0 se sconosciuta.
+    """
+    year, month, day = parse_pub_date(raw)
+    return year * 10000 + month * 100 + day
+
+
+def pub_year(raw):
+    return parse_pub_date(raw)[0]
+
+
+def date_bound(value, upper=False):
+    """
+    Estremo di un filtro di date (`2022`, `2022-06`, `2022-06-30`) come intero YYYYMMDD.
+    Un estremo superiore parziale copre tutto l'anno/mese (`2022` → 20229999).
+    """
+    year, month, day = parse_pub_date(str(value))
+    if not year:
+        raise ValueError(f"Invalid date: {value!r}")
+    if upper:
+        return year * 10000 + (month or 99) * 100 + (day or 99)
+    return year * 10000 + month * 100 + day
@@ -0,0 +1,31 @@
+from qdrant_client.http import models
+
+from common.pubdate import date_bound
+
+
+def build_search_filter(date_from=None, date_to=None, authors=None, journal=None):
+    """
+    Filtro Qdrant per la ricerca, valutato lato server sugli indici di payload
+    (`pub_date_int`, `authors`, `journal`). Ritorna None se non c'è nessuna condizione.
+    Le date accettano `YYYY`, `YYYY-MM` o `YYYY-MM-DD`; con più autori basta che ne compaia uno.
+    Con un filtro sulle date gli articoli senza data (`pub_date_int` = 0) sono sempre esclusi.
+    """
+    conditions = []
+    if date_from or date_to:
+        conditions.append(models.FieldCondition(
+            key="pub_date_int",
+            range=models.Range(
+                # Senza limite inferiore: gte=1 esclude comunque i record senza data (0)
+                gte=date_bound(date_from) if date_from else 1,
+                lte=date_bound(date_to, upper=True) if date_to else None,
+            ),
+        ))
+    if authors:
+        if isinstance(authors, str):
+            authors = [authors]
+        conditions.append(models.FieldCondition(key="authors", match=models.MatchAny(any=list(authors))))
+    if journal:
+        conditions.append(models.FieldCondition(key="journal", match=models.MatchValue(value=journal)))
+    if not conditions:
+        return None
+    return models.Filter(must=conditions)
@@ -0,0 +1,98 @@
+import hashlib
+import json
+import sqlite3
+import threading
+
+LOOKUP_CHUNK = 500  # PMID per query IN (...), sotto il limite di variabili di SQLite
+
+
+def content_hash(art):
+    """
+    Hash stabile del contenuto di un articolo (indipendente dall'ordine delle chiavi).
+    """
+    data = json.dumps(art, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+
+class IngestManifest:
+    """
+    Manifest SQLite PMID → hash del contenuto degli articoli già caricati su Qdrant.
+    Permette di rielaborare solo gli articoli nuovi o modificati. Thread-safe.
+    """
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS articles (pmid TEXT PRIMARY KEY, content_hash TEXT NOT NULL)"
+            )
+            self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            self.conn.commit()
+
+    def ensure_profile(self, profile):
+        """
+        Confronta `profile` (formato dei punti: versione dello schema del payload, docstore, vettori sparsi, ...)
+        con quello dell'ultimo caricamento. Se è cambiato i punti già caricati vanno riscritti:
+        il manifest viene azzerato. Ritorna True se è stato azzerato.
+        """
+        value = json.dumps(profile, sort_keys=True)
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = 'profile'").fetchone()
+            if row is None:
+                # Manifest di una versione precedente (senza profilo): i punti hanno il formato vecchio
+                changed = self.conn.execute("SELECT 1 FROM articles LIMIT 1").fetchone() is not None
+            else:
+                changed = row[0] != value
+            if changed:
+                self.conn.execute("DELETE FROM articles")
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('profile', ?)", (value,))
+            self.conn.commit()
+        return changed
+
+    def filter_changed(self, articles):
+        """
+        Ritorna gli articoli il cui hash non è nel manifest (nuovi o modificati).
+        """
+        hashes = {art.get("pmid"): content_hash(art) for art in articles}
+        pmids = list(hashes)
+        known = {}
+        with self.lock:
+            for i in range(0, len(pmids), LOOKUP_CHUNK):
+                chunk = pmids[i:i + LOOKUP_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self.conn.execute(
+                    f"SELECT pmid, content_hash FROM articles WHERE pmid IN ({placeholders})", chunk
+                )
+                known.update(rows)
+        return [art for art in articles if known.get(art.get("pmid")) != hashes[art.get("pmid")]]
+
+    def iter_changed(self, articles, chunk_size=1000):
+        """
+        Filtra uno stream di articoli lasciando passare solo quelli nuovi o modificati.
+        """
+        chunk = []
+        for art in articles:
+            chunk.append(art)
+            if len(chunk) == chunk_size:
+                yield from self.filter_changed(chunk)
+                chunk = []
+        if chunk:
+            yield from self.filter_changed(chunk)
+
+    def mark_uploaded(self, articles):
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO articles (pmid, content_hash) VALUES (?, ?)",
+                [(art.get("pmid"), content_hash(art)) for art in articles]
+            )
+            self.conn.commit()
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM articles")
+            self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
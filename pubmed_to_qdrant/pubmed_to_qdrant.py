@@ -1,92 +1,332 @@
 import os
-import json
+import sys
+import argparse
+import queue
+import threading
+import uuid
+import numpy as np
 from sentence_transformers import SentenceTransformer
 from qdrant_client import QdrantClient
-from qdrant_client.http.models import PointStruct
+from qdrant_client.http.models import PointStruct, SparseVector
 from dotenv import load_dotenv
 
 load_dotenv()
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common import metrics  # noqa: E402
+from common.article_store import iter_articles  # noqa: E402
+from common.embedding_cache import DEFAULT_CAPACITY, EmbeddingCache  # noqa: E402
+from common.docstore import DocStoreWriter  # noqa: E402
+from common.pubdate import normalize_pub_date, pub_date_int, pub_year  # noqa: E402
+from common.bm25 import SPARSE_VECTOR_NAME, BM25Vocabulary  # noqa: E402
+from common.local_vector_store import LocalVectorStore  # noqa: E402
+from ingest_manifest import IngestManifest  # noqa: E402
+from qdrant_loader import (  # noqa: E402
+    UPLOAD_BATCH_SIZE, UPLOAD_WORKERS, BulkUploader, CollectionProfile,
+    create_collection, ensure_payload_indexes, finish_bulk_load, has_sparse_vectors, mark_collection_updated,
+)
+
 # Inizializza modello embedding
-model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+
+# Cache persistente degli embedding (disattivata se EMBEDDING_CACHE_DIR non è impostata)
+embedding_cache = None
+
+# Docstore locale per titolo/abstract (disattivato se DOCSTORE_DIR non è impostata):
+# se attivo, su Qdrant restano solo i campi filtrabili
+docstore_writer = None
+
+# Vocabolario BM25 per i vettori sparsi (None = solo vettori densi)
+bm25_vocab = None
 
 # Inizializza client Qdrant (default localhost)
 qdrant_url = os.getenv("QDRANT_URL", "http://localhost:6333")
 qdrant_api_key = os.getenv("QDRANT_API_KEY", None)
-client = QdrantClient(url=qdrant_url, api_key=qdrant_api_key)
+# gRPC (porta 6334) riduce l'overhead di serializzazione nei caricamenti massivi
+qdrant_prefer_grpc = os.getenv("QDRANT_PREFER_GRPC", "").lower() in ("1", "true", "yes")
+client = QdrantClient(url=qdrant_url, api_key=qdrant_api_key, prefer_grpc=qdrant_prefer_grpc)
 
 COLLECTION_NAME = "pubmed_articles"
+EMBEDDING_BATCH_SIZE = 128
+PIPELINE_QUEUE_SIZE = 4  # batch in attesa tra uno stadio e il successivo (backpressure)
+MANIFEST_PATH = "ingest_manifest.sqlite"
+# Versione del formato dei punti (campi del payload, vettori): va incrementata quando prepare_points cambia,
+# così --incremental ricarica anche gli articoli già presenti
+INGEST_SCHEMA_VERSION = 2
+BM25_VOCAB_PATH = os.getenv("BM25_VOCAB", "bm25_vocab.json")
+# Backend vettoriale: "qdrant" (server) oppure "local" (common/local_vector_store.py, nessun servizio)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "qdrant")
+LOCAL_STORE_DIR = os.getenv("LOCAL_STORE_DIR", "local_vector_store")
 
-def create_collection_if_not_exists():
-    try:
-        client.get_collection(COLLECTION_NAME)
+# Namespace fisso per gli ID UUID dei PMID non numerici: stesso PMID → stesso ID in ogni esecuzione
+POINT_ID_NAMESPACE = uuid.UUID("8f3c2a4e-5b1d-4c7e-9a6f-0d2b3e4f5a61")
+
+_DONE = object()
+
+def create_collection_if_not_exists(profile=None):
+    """
+    Crea la collection secondo `profile` (CollectionProfile) se non esiste.
+    Ritorna True se la collection è stata appena creata.
+    """
+    profile = profile or CollectionProfile()
+    if client.collection_exists(COLLECTION_NAME):
         print(f"Collection '{COLLECTION_NAME}' esiste già.")
-    except:
-        print(f"Creazione collection '{COLLECTION_NAME}'...")
-        client.recreate_collection(
-            collection_name=COLLECTION_NAME,
-            vectors_config={"size": 384, "distance": "Cosine"},
-        )
-
-def load_articles(path):
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
-
-def generate_embedding(text):
-    return model.encode(text).tolist()
-
-def clean_pub_date(pub_date: str) -> str:
-    # Rimuove trattini finali e spazi inutili
-    if pub_date:
-        pub_date = pub_date.strip()
-        if pub_date.endswith("-"):
-            pub_date = pub_date.rstrip("-").strip()
-    return pub_date
-
-def prepare_points(articles):
+        ensure_payload_indexes(client, COLLECTION_NAME, profile)
+        return False
+    print(f"Creazione collection '{COLLECTION_NAME}'...")
+    create_collection(client, COLLECTION_NAME, profile)
+    return True
+
+@metrics.timed()
+def embed_texts(texts, batch_size=EMBEDDING_BATCH_SIZE, pool=None):
+    """
+    Calcola gli embedding di una lista di testi a batch e ritorna una matrice float32 contigua
+    (una riga per testo, nello stesso ordine dell'input).
+    I testi vengono ordinati per lunghezza così ogni batch ha padding minimo; con `pool`
+    (vedi `model.start_multi_process_pool`) il lavoro viene distribuito su più processi.
+    Se `embedding_cache` è attiva vengono calcolati solo i testi non ancora in cache.
+    """
+    if not texts:
+        return np.empty((0, model.get_sentence_embedding_dimension()), dtype=np.float32)
+
+    if embedding_cache is not None:
+        embeddings, missing = embedding_cache.get_many(texts)
+        if missing:
+            missing_texts = [texts[i] for i in missing]
+            computed = _encode_sorted(missing_texts, batch_size, pool)
+            embeddings[missing] = computed
+            embedding_cache.put_many(missing_texts, computed)
+        return embeddings
+
+    return _encode_sorted(texts, batch_size, pool)
+
+def _encode_sorted(texts, batch_size, pool):
+    order = np.argsort([len(t) for t in texts], kind="stable")
+    sorted_texts = [texts[i] for i in order]
+    if pool is not None:
+        vectors = model.encode_multi_process(sorted_texts, pool, batch_size=batch_size)
+    else:
+        vectors = model.encode(sorted_texts, batch_size=batch_size, convert_to_numpy=True, show_progress_bar=False)
+
+    embeddings = np.empty((len(texts), vectors.shape[1]), dtype=np.float32)
+    embeddings[order] = vectors
+    return embeddings
+
+def article_text(art):
+    # Concateno titolo + abstract
+    return f"{art.get('title','')} {art.get('abstract','')}"
+
+@metrics.timed()
+def prepare_points(articles, batch_size=EMBEDDING_BATCH_SIZE, pool=None):
+    embeddings = embed_texts([article_text(art) for art in articles], batch_size=batch_size, pool=pool)
+
     points = []
-    for art in articles:
-        # Concateno titolo + abstract
-        text = f"{art.get('title','')} {art.get('abstract','')}"
-        embedding = generate_embedding(text)
+    for art, embedding in zip(articles, embeddings):
+        # La conversione in lista avviene solo qui, al confine con il client Qdrant
+        vector = embedding.tolist()
+        if bm25_vocab is not None:
+            # Vettore denso senza nome + vettore sparso BM25 per la ricerca ibrida
+            indices, values = bm25_vocab.document_vector(article_text(art))
+            vector = {"": vector, SPARSE_VECTOR_NAME: SparseVector(indices=indices, values=values)}
 
-        # Pulizia della data
-        pub_date = clean_pub_date(art.get("pub_date", ""))
+        # Data normalizzata: stringa ISO per la visualizzazione, intero YYYYMMDD e anno per i filtri
+        raw_date = art.get("pub_date", "")
 
         payload = {
             "title": art.get("title", ""),
             "abstract": art.get("abstract", ""),
             "pmid": art.get("pmid", ""),
             "authors": art.get("authors", []),
-            "pub_date": pub_date
+            "journal": art.get("journal", ""),
+            "pub_date": normalize_pub_date(raw_date),
+            "pub_date_int": pub_date_int(raw_date),
+            "pub_year": pub_year(raw_date),
         }
+        if docstore_writer is not None:
+            docstore_writer.add(payload["pmid"], {
+                "title": payload.pop("title"),
+                "abstract": payload.pop("abstract"),
+                "doi": art.get("doi", ""),
+            })
 
-        # Usa pmid come int, fallback a id incrementale se pmid non è convertibile
-        try:
-            point_id = int(art.get("pmid"))
-        except (ValueError, TypeError):
-            # fallback a hash o id alternativo
-            point_id = hash(art.get("pmid"))
+        point_id = point_id_for(art.get("pmid"))
 
-        point = PointStruct(id=point_id, vector=embedding, payload=payload)
+        point = PointStruct(id=point_id, vector=vector, payload=payload)
         points.append(point)
     return points
 
-def upload_to_qdrant(points):
+def point_id_for(pmid):
+    # Usa pmid come int, fallback a UUID deterministico se pmid non è convertibile
+    # (non usare hash(): cambia a ogni processo con PYTHONHASHSEED e crea duplicati)
+    try:
+        return int(pmid)
+    except (ValueError, TypeError):
+        return str(uuid.uuid5(POINT_ID_NAMESPACE, str(pmid)))
+
+@metrics.timed()
+def upload_to_qdrant(points, batch_size=UPLOAD_BATCH_SIZE, workers=UPLOAD_WORKERS, wait=False):
     print(f"Caricamento di {len(points)} punti su Qdrant...")
-    batch_size = 100
-    for i in range(0, len(points), batch_size):
-        batch = points[i:i+batch_size]
-        client.upsert(collection_name=COLLECTION_NAME, points=batch)
-        print(f" - Caricati {i + len(batch)} / {len(points)}")
+    with BulkUploader(client, COLLECTION_NAME, batch_size=batch_size, workers=workers, wait=wait) as uploader:
+        uploader.submit(points)
+    print(f" - Caricati {uploader.uploaded} / {len(points)}")
+
+def iter_batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def run_pipeline(path, batch_size=EMBEDDING_BATCH_SIZE, pool=None, queue_size=PIPELINE_QUEUE_SIZE, manifest=None,
+                 uploader=None):
+    """
+    Ingestion in streaming: un thread legge gli articoli a batch, il thread principale calcola
+    gli embedding e `uploader` (BulkUploader) invia i punti a Qdrant in parallelo. Coda di lettura e
+    batch in volo sono limitati, quindi la memoria resta costante e embedding e upload si sovrappongono.
+    Con `manifest` (IngestManifest) vengono elaborati solo gli articoli nuovi o modificati, e il manifest
+    viene aggiornato solo dopo l'upsert riuscito.
+    Ritorna il numero di punti caricati.
+    """
+    article_queue = queue.Queue(maxsize=queue_size)
+    errors = []
+    uploader = uploader or BulkUploader(client, COLLECTION_NAME)
+
+    def reader():
+        try:
+            articles = iter_articles(path)
+            if manifest is not None:
+                articles = manifest.iter_changed(articles)
+            for batch in iter_batches(articles, batch_size):
+                article_queue.put(batch)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            article_queue.put(_DONE)
+
+    def on_uploaded(articles):
+        if manifest is not None:
+            # Testi nel docstore su disco prima di segnare il batch come caricato:
+            # dopo un crash i punti ridotti su Qdrant hanno sempre il loro record
+            if docstore_writer is not None:
+                docstore_writer.flush()
+            manifest.mark_uploaded(articles)
+        print(f" - Caricati {uploader.uploaded} punti")
+
+    threading.Thread(target=reader, daemon=True).start()
+
+    with uploader:
+        while not errors:
+            articles = article_queue.get()
+            if articles is _DONE:
+                break
+            points = prepare_points(articles, batch_size=batch_size, pool=pool)
+            uploader.submit(points, on_done=lambda articles=articles: on_uploaded(articles))
+
+    if errors:
+        raise errors[0]
+    return uploader.uploaded
 
 def main():
-    create_collection_if_not_exists()
+    parser = argparse.ArgumentParser(description="Carica articoli PubMed su Qdrant")
+    parser.add_argument("--input", default="pubmed_articles.jsonl", help="File JSONL di articoli")
+    parser.add_argument("--batch-size", type=int, default=EMBEDDING_BATCH_SIZE, help="Testi per batch di embedding")
+    parser.add_argument("--processes", type=int, default=0, help="Processi CPU per l'embedding (0 = processo singolo)")
+    parser.add_argument("--queue-size", type=int, default=PIPELINE_QUEUE_SIZE, help="Batch in coda tra gli stadi della pipeline")
+    parser.add_argument("--incremental", action="store_true", help="Carica solo articoli nuovi o modificati (manifest PMID → hash)")
+    parser.add_argument("--manifest", default=MANIFEST_PATH, help="Percorso del manifest SQLite per --incremental")
+    parser.add_argument("--upload-batch-size", type=int, default=UPLOAD_BATCH_SIZE, help="Punti per richiesta di upsert")
+    parser.add_argument("--upload-workers", type=int, default=UPLOAD_WORKERS, help="Richieste di upsert in parallelo")
+    parser.add_argument("--wait", action="store_true", help="Attende l'indicizzazione di ogni batch (più lento)")
+    parser.add_argument("--hnsw-m", type=int, default=16, help="Parametro m del grafo HNSW")
+    parser.add_argument("--hnsw-ef-construct", type=int, default=100, help="Parametro ef_construct del grafo HNSW")
+    parser.add_argument("--no-quantization", action="store_true", help="Disattiva la quantizzazione scalare int8")
+    parser.add_argument("--vectors-in-ram", action="store_true", help="Mantiene i vettori originali in RAM invece che su disco")
+    parser.add_argument("--no-defer-indexing", action="store_true", help="Costruisce l'HNSW durante il caricamento")
+    parser.add_argument("--no-sparse", action="store_true", help="Solo vettori densi (niente BM25 / ricerca ibrida)")
+    parser.add_argument("--bm25-vocab", default=BM25_VOCAB_PATH, help="File JSON del vocabolario BM25")
+    parser.add_argument("--backend", choices=["qdrant", "local"], default=VECTOR_BACKEND, help="Dove salvare i vettori")
+    parser.add_argument("--local-store", default=LOCAL_STORE_DIR, help="Cartella del backend locale")
+    parser.add_argument("--local-int8", action="store_true", help="Backend locale: vettori int8 invece di float32")
+    parser.add_argument("--ivf-lists", type=int, default=0, help="Backend locale: liste IVF da costruire alla fine (0 = ricerca esatta)")
+    parser.add_argument("--docstore", default=os.getenv("DOCSTORE_DIR"), help="Cartella del docstore locale (payload Qdrant ridotto)")
+    parser.add_argument("--embedding-cache", default=os.getenv("EMBEDDING_CACHE_DIR"), help="Cartella della cache embedding su disco")
+    parser.add_argument("--embedding-cache-size", type=int, default=DEFAULT_CAPACITY, help="Numero massimo di embedding in cache")
+    args = parser.parse_args()
+
+    global embedding_cache, docstore_writer, bm25_vocab, client
+    if args.docstore:
+        docstore_writer = DocStoreWriter(args.docstore)
+    if args.embedding_cache:
+        embedding_cache = EmbeddingCache(args.embedding_cache, EMBEDDING_MODEL_NAME,
+                                         model.get_sentence_embedding_dimension(), capacity=args.embedding_cache_size)
+
+    profile = CollectionProfile(
+        on_disk_vectors=not args.vectors_in_ram,
+        quantization=not args.no_quantization,
+        hnsw_m=args.hnsw_m,
+        hnsw_ef_construct=args.hnsw_ef_construct,
+        defer_indexing=not args.no_defer_indexing,
+        sparse=not args.no_sparse and args.backend == "qdrant",
+    )
+    local = args.backend == "local"
+    if local:
+        # Il backend locale ha la stessa interfaccia di upsert del client Qdrant (solo vettori densi)
+        client = LocalVectorStore(args.local_store, dim=model.get_sentence_embedding_dimension(), quantize=args.local_int8)
+        created = len(client) == 0
+    else:
+        created = create_collection_if_not_exists(profile)
 
-    articles = load_articles("pubmed_articles.json")  # Il tuo file JSON di articoli
-    points = prepare_points(articles)
-    upload_to_qdrant(points)
-    print("✅ Upload completato.")
+    if profile.sparse:
+        if has_sparse_vectors(client, COLLECTION_NAME):
+            # Prima passata in streaming sul corpus per il vocabolario; gli indici già assegnati restano stabili
+            previous = None
+            if not created and os.path.exists(args.bm25_vocab):
+                previous = BM25Vocabulary.load(args.bm25_vocab)
+            bm25_vocab = BM25Vocabulary.build((article_text(art) for art in iter_articles(args.input)), previous=previous)
+            bm25_vocab.save(args.bm25_vocab)
+            print(f"📚 Vocabolario BM25: {len(bm25_vocab.terms)} termini → {args.bm25_vocab}")
+        else:
+            print(f"⚠️ La collection '{COLLECTION_NAME}' non ha vettori sparsi: caricamento solo denso (ricreala per la ricerca ibrida).")
+
+    manifest = None
+    if args.incremental:
+        manifest = IngestManifest(args.manifest)
+        if created:
+            # Collection nuova: il manifest di una collection precedente non è più valido
+            manifest.clear()
+        ingest_profile = {"schema": INGEST_SCHEMA_VERSION, "docstore": docstore_writer is not None,
+                          "sparse": bm25_vocab is not None, "backend": args.backend}
+        if manifest.ensure_profile(ingest_profile):
+            print("♻️ Formato dei punti cambiato (payload, docstore o vettori sparsi): ricarico tutti gli articoli.")
+
+    pool = model.start_multi_process_pool(target_devices=["cpu"] * args.processes) if args.processes > 1 else None
+    try:
+        uploader = BulkUploader(client, COLLECTION_NAME, batch_size=args.upload_batch_size,
+                                workers=1 if local else args.upload_workers, wait=args.wait or local)
+        total = run_pipeline(args.input, batch_size=args.batch_size, pool=pool, queue_size=args.queue_size,
+                             manifest=manifest, uploader=uploader)
+    finally:
+        if pool is not None:
+            model.stop_multi_process_pool(pool)
+        if manifest is not None:
+            manifest.close()
+        if embedding_cache is not None:
+            embedding_cache.close()
+        if docstore_writer is not None:
+            docstore_writer.close()
+    if local:
+        if args.ivf_lists:
+            client.build_ivf(args.ivf_lists)
+        client.close()
+    else:
+        # Collection caricata senza HNSW: ora si costruisce l'indice una volta sola
+        finish_bulk_load(client, COLLECTION_NAME, profile)
+        mark_collection_updated(client, COLLECTION_NAME)
+    print(f"✅ Upload completato: {total} punti.")
 
 if __name__ == "__main__":
     main()
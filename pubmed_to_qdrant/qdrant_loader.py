@@ -0,0 +1,202 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from qdrant_client.http import models
+
+from common import metrics
+from common.bm25 import SPARSE_VECTOR_NAME
+
+UPLOAD_BATCH_SIZE = 256
+UPLOAD_WORKERS = 4
+MAX_RETRIES = 3
+
+
+@dataclass
+class CollectionProfile:
+    """
+    Configurazione della collection Qdrant per il caricamento massivo.
+    Con `defer_indexing` la collection nasce senza grafo HNSW (m=0), così durante il caricamento
+    Qdrant non ricostruisce l'indice a ogni segmento; `finish_bulk_load` lo riattiva alla fine.
+    """
+    vector_size: int = 384
+    distance: str = "Cosine"
+    on_disk_vectors: bool = True  # vettori originali su disco (usati solo per il rescoring)
+    quantization: bool = True  # quantizzazione scalare int8 mantenuta in RAM
+    quantile: float = 0.99
+    hnsw_m: int = 16
+    hnsw_ef_construct: int = 100
+    defer_indexing: bool = True
+    sparse: bool = True  # vettori sparsi BM25 (vettore denso senza nome, sparso "bm25") per la ricerca ibrida
+    payload_indexes: dict = field(default_factory=lambda: {
+        "pmid": models.PayloadSchemaType.KEYWORD,
+        "pub_date": models.PayloadSchemaType.KEYWORD,
+        "pub_date_int": models.PayloadSchemaType.INTEGER,  # filtri di range sulle date
+        "pub_year": models.PayloadSchemaType.INTEGER,
+        "authors": models.PayloadSchemaType.KEYWORD,
+        "journal": models.PayloadSchemaType.KEYWORD,
+    })
+
+
+def create_collection(client, collection_name, profile):
+    quantization_config = None
+    if profile.quantization:
+        quantization_config = models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(
+                type=models.ScalarType.INT8,
+                quantile=profile.quantile,
+                always_ram=True,
+            )
+        )
+    client.create_collection(
+        collection_name=collection_name,
+        vectors_config=models.VectorParams(
+            size=profile.vector_size,
+            distance=models.Distance(profile.distance),
+            on_disk=profile.on_disk_vectors,
+        ),
+        hnsw_config=models.HnswConfigDiff(
+            m=0 if profile.defer_indexing else profile.hnsw_m,
+            ef_construct=profile.hnsw_ef_construct,
+        ),
+        quantization_config=quantization_config,
+        sparse_vectors_config={
+            # IDF calcolato da Qdrant sulle statistiche della collection: nei punti c'è solo la parte tf
+            SPARSE_VECTOR_NAME: models.SparseVectorParams(modifier=models.Modifier.IDF)
+        } if profile.sparse else None,
+    )
+    ensure_payload_indexes(client, collection_name, profile)
+
+
+def ensure_payload_indexes(client, collection_name, profile):
+    # Creare un indice già esistente non ha effetti: lo si può chiamare anche su collection esistenti
+    for field_name, schema in profile.payload_indexes.items():
+        client.create_payload_index(collection_name=collection_name, field_name=field_name, field_schema=schema)
+
+
+def has_sparse_vectors(client, collection_name):
+    sparse_vectors = client.get_collection(collection_name).config.params.sparse_vectors
+    return bool(sparse_vectors) and SPARSE_VECTOR_NAME in sparse_vectors
+
+
+def mark_collection_updated(client, collection_name):
+    """
+    Registra nei metadati della collection l'ora dell'ultimo caricamento: la cache delle risposte
+    della ricerca la usa per invalidarsi. Le versioni di Qdrant senza metadati vengono ignorate.
+    """
+    try:
+        client.update_collection(collection_name=collection_name, metadata={"updated_at": time.time()})
+    except Exception as e:
+        logging.warning(f"Could not update collection metadata: {e}")
+
+
+def finish_bulk_load(client, collection_name, profile):
+    """
+    Riattiva la costruzione del grafo HNSW se la collection è ancora senza indice (m=0), cioè dopo
+    un caricamento con `defer_indexing`, anche se interrotto in un'esecuzione precedente.
+    """
+    hnsw_config = client.get_collection(collection_name).config.hnsw_config
+    if hnsw_config is not None and hnsw_config.m == 0:
+        client.update_collection(
+            collection_name=collection_name,
+            hnsw_config=models.HnswConfigDiff(m=profile.hnsw_m, ef_construct=profile.hnsw_ef_construct),
+        )
+
+
+class BulkUploader:
+    """
+    Caricamento parallelo su Qdrant: i punti vengono divisi in batch da `batch_size` e inviati
+    da `workers` thread. Con `wait=False` Qdrant conferma appena l'operazione è nel WAL, senza
+    aspettare l'indicizzazione; `close()` fa da barriera finale di consistenza.
+    Solo i batch falliti vengono ritentati (fino a MAX_RETRIES volte).
+    Con il client locale (`QdrantClient(":memory:")` o `path=...`), che non è thread-safe, usare workers=1.
+    """
+
+    def __init__(self, client, collection_name, batch_size=UPLOAD_BATCH_SIZE, workers=UPLOAD_WORKERS, wait=False):
+        self.client = client
+        self.collection_name = collection_name
+        self.batch_size = batch_size
+        self.wait = wait
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        # Limita i batch in volo: submit() si blocca se Qdrant non tiene il passo (backpressure)
+        self.slots = threading.BoundedSemaphore(workers * 2)
+        self.lock = threading.Lock()
+        self.errors = []
+        self.last_batch = None
+        self.uploaded = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.pool.shutdown(wait=True)
+
+    def submit(self, points, on_done=None):
+        """
+        Accoda una lista di punti. `on_done` viene chiamata quando tutti i suoi batch sono stati accettati.
+        """
+        self._raise_if_failed()
+        batches = [points[i:i + self.batch_size] for i in range(0, len(points), self.batch_size)]
+        if not batches:
+            if on_done:
+                on_done()
+            return
+        remaining = [len(batches)]
+
+        def batch_done():
+            with self.lock:
+                remaining[0] -= 1
+                finished = remaining[0] == 0
+            if finished and on_done:
+                on_done()
+
+        for batch in batches:
+            self.slots.acquire()
+            # Future non conservati: errori raccolti in _send, barriera finale con pool.shutdown
+            self.pool.submit(self._send, batch, batch_done)
+            self.last_batch = batch
+
+    def _send(self, batch, batch_done):
+        try:
+            attempt = 0
+            while True:
+                try:
+                    with metrics.span("qdrant_upsert"):
+                        self.client.upsert(collection_name=self.collection_name, points=batch, wait=self.wait)
+                    break
+                except Exception as e:
+                    metrics.count("qdrant_upsert_retries")
+                    attempt += 1
+                    if attempt > MAX_RETRIES:
+                        raise
+                    logging.warning(f"Upsert failed ({attempt}/{MAX_RETRIES}), retrying batch of {len(batch)} points: {e}")
+                    time.sleep(2 ** attempt)
+            metrics.count("points_uploaded", len(batch))
+            with self.lock:
+                self.uploaded += len(batch)
+            batch_done()
+        except Exception as e:
+            with self.lock:
+                self.errors.append(e)
+        finally:
+            self.slots.release()
+
+    def _raise_if_failed(self):
+        if self.errors:
+            raise self.errors[0]
+
+    def close(self):
+        """
+        Attende tutti i batch e, se si è caricato con wait=False, rinvia l'ultimo batch con wait=True:
+        Qdrant applica gli aggiornamenti in ordine, quindi la sua conferma implica che anche tutti i
+        precedenti sono stati applicati.
+        """
+        self.pool.shutdown(wait=True)
+        self._raise_if_failed()
+        if not self.wait and self.last_batch is not None:
+            self.client.upsert(collection_name=self.collection_name, points=self.last_batch, wait=True)
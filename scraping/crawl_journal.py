@@ -0,0 +1,225 @@
+import json
+import sqlite3
+import time
+
+JOURNAL_SUFFIX = ".journal"
+
+PENDING = "pending"
+DONE = "done"
+FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS crawls (
+    id INTEGER PRIMARY KEY,
+    signature TEXT UNIQUE NOT NULL,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS partitions (
+    crawl_id INTEGER NOT NULL,
+    idx INTEGER NOT NULL,
+    start_date TEXT NOT NULL,
+    end_date TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    done INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (crawl_id, idx)
+);
+CREATE TABLE IF NOT EXISTS pmids (
+    crawl_id INTEGER NOT NULL,
+    partition INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    pmid TEXT NOT NULL,
+    PRIMARY KEY (crawl_id, partition, position)
+);
+CREATE TABLE IF NOT EXISTS batches (
+    crawl_id INTEGER NOT NULL,
+    idx INTEGER NOT NULL,
+    retstart INTEGER NOT NULL,
+    pmids TEXT NOT NULL,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    updated REAL NOT NULL,
+    PRIMARY KEY (crawl_id, idx)
+);
+"""
+
+
+class CrawlJournal:
+    """
+    Journal SQLite di una scansione (`<output>.journal`): piano delle partizioni per data, lista dei PMID
+    e stato di ogni batch efetch (pending / done / failed). Ogni aggiornamento è una transazione,
+    quindi dopo un crash la scansione riparte da dove si era fermata senza rifare esearch né rileggere l'output.
+    I batch falliti dopo MAX_RETRIES restano `failed` (coda dei falliti) e vengono ritentati
+    alla fine dell'esecuzione e a quella successiva.
+
+    Una scansione è identificata dalla sua `signature` (script, query e parametri): cambiando query
+    nello stesso file di output ne viene creata una nuova. Si riprende solo una scansione non terminata
+    (partizioni da scaricare o batch pending/failed): se all'apertura è già completa viene svuotata
+    (`restarted` è True) e la nuova esecuzione rifà esearch, così trova gli articoli pubblicati nel frattempo;
+    quelli già salvati vengono saltati dall'archivio.
+    """
+
+    def __init__(self, path, signature):
+        self.path = path
+        self.conn = sqlite3.connect(path, isolation_level=None, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        key = json.dumps(signature, sort_keys=True)
+        self.conn.execute("INSERT OR IGNORE INTO crawls (signature, created) VALUES (?, ?)", (key, time.time()))
+        self.crawl_id = self.conn.execute("SELECT id FROM crawls WHERE signature = ?", (key,)).fetchone()[0]
+        self.restarted = self.finished()
+        if self.restarted:
+            self.restart()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def _transaction(self, statements):
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            for sql, rows in statements:
+                self.conn.executemany(sql, rows)
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    # --- Piano delle partizioni e PMID ---
+
+    def partitions(self):
+        """
+        Piano salvato: lista di (start, end, count, done) con date ISO, oppure None se non ancora calcolato.
+        """
+        rows = self.conn.execute(
+            "SELECT start_date, end_date, count, done FROM partitions WHERE crawl_id = ? ORDER BY idx", (self.crawl_id,)
+        ).fetchall()
+        return [(start, end, count, bool(done)) for start, end, count, done in rows] or None
+
+    def save_partitions(self, partitions):
+        # `partitions`: lista di (start, end, count), con start/end date ISO
+        self._transaction([
+            ("DELETE FROM partitions WHERE crawl_id = ?", [(self.crawl_id,)]),
+            ("INSERT INTO partitions (crawl_id, idx, start_date, end_date, count) VALUES (?, ?, ?, ?, ?)",
+             [(self.crawl_id, i, start, end, count) for i, (start, end, count) in enumerate(partitions)]),
+        ])
+
+    def save_pmids(self, pmids, partition=0, done=True):
+        """
+        Salva (sostituendoli) i PMID di una partizione; con `done=True` la partizione non verrà più riscaricata
+        e il suo `count` diventa il numero di PMID salvati. Senza piano per date (script principale)
+        tutti i PMID stanno nella partizione 0.
+        """
+        statements = [
+            ("DELETE FROM pmids WHERE crawl_id = ? AND partition = ?", [(self.crawl_id, partition)]),
+            ("INSERT INTO pmids (crawl_id, partition, position, pmid) VALUES (?, ?, ?, ?)",
+             [(self.crawl_id, partition, i, pmid) for i, pmid in enumerate(pmids)]),
+        ]
+        if self.partitions() is None:
+            statements.append(("INSERT INTO partitions (crawl_id, idx, start_date, end_date, count) VALUES (?, ?, '', '', ?)",
+                               [(self.crawl_id, partition, len(pmids))]))
+        # Una partizione incompleta tiene il count del piano: alla ripresa serve come retmax
+        statements.append(("UPDATE partitions SET done = ?, count = CASE WHEN ? THEN ? ELSE count END "
+                           "WHERE crawl_id = ? AND idx = ?",
+                           [(int(done), int(done), len(pmids), self.crawl_id, partition)]))
+        self._transaction(statements)
+
+    def pmids_complete(self):
+        partitions = self.partitions()
+        return partitions is not None and all(done for *_, done in partitions)
+
+    def pmids(self):
+        """
+        PMID salvati, nell'ordine delle partizioni e del result set, senza duplicati.
+        """
+        rows = self.conn.execute(
+            "SELECT pmid FROM pmids WHERE crawl_id = ? ORDER BY partition, position", (self.crawl_id,)
+        )
+        return list(dict.fromkeys(pmid for (pmid,) in rows))
+
+    def finished(self):
+        """
+        True se la scansione è terminata: PMID completi, tutti pianificati in batch e nessun batch pending/failed.
+        """
+        if not self.pmids_complete():
+            return False
+        planned = 0
+        for state, pmids in self.conn.execute("SELECT state, pmids FROM batches WHERE crawl_id = ?", (self.crawl_id,)):
+            if state != DONE:
+                return False
+            planned += len(pmids.split(",")) if pmids else 0
+        # Crash tra il salvataggio dei PMID e `plan_batches`: la scansione va ripresa
+        return planned == len(self.pmids())
+
+    def restart(self):
+        """
+        Svuota piano, PMID e batch della scansione: la prossima esecuzione la rifà da esearch.
+        """
+        self._transaction([
+            (f"DELETE FROM {table} WHERE crawl_id = ?", [(self.crawl_id,)]) for table in ("partitions", "pmids", "batches")
+        ])
+
+    # --- Batch efetch ---
+
+    def plan_batches(self, pmids, batch_size):
+        """
+        Divide in batch `pending` i PMID non ancora pianificati. I batch già salvati restano invariati
+        (anche se `batch_size` è cambiato): alla ripresa si aggiungono solo i PMID nuovi, es. quelli
+        di una partizione riscaricata. `retstart` è la posizione del primo PMID del batch in `pmids`.
+        Ritorna il numero totale di batch.
+        """
+        planned, next_idx = set(), 0
+        for idx, batch_pmids in self.conn.execute("SELECT idx, pmids FROM batches WHERE crawl_id = ?", (self.crawl_id,)):
+            planned.update(batch_pmids.split(","))
+            next_idx = max(next_idx, idx + 1)
+
+        positions = {pmid: i for i, pmid in reversed(list(enumerate(pmids)))}
+        new_pmids = [pmid for pmid in positions if pmid not in planned]
+        new_pmids.sort(key=positions.get)
+        now = time.time()
+        rows = [
+            (self.crawl_id, next_idx + n, positions[new_pmids[i]], ",".join(new_pmids[i:i + batch_size]), PENDING, now)
+            for n, i in enumerate(range(0, len(new_pmids), batch_size))
+        ]
+        if rows:
+            self._transaction([
+                ("INSERT INTO batches (crawl_id, idx, retstart, pmids, state, updated) VALUES (?, ?, ?, ?, ?, ?)", rows),
+            ])
+        return next_idx + len(rows)
+
+    def batches(self, state):
+        """
+        Batch nello stato indicato, come tuple (idx, retstart, lista di PMID).
+        """
+        rows = self.conn.execute(
+            "SELECT idx, retstart, pmids FROM batches WHERE crawl_id = ? AND state = ? ORDER BY idx",
+            (self.crawl_id, state),
+        )
+        return [(idx, retstart, pmids.split(",") if pmids else []) for idx, retstart, pmids in rows]
+
+    def mark_done(self, idx):
+        self.conn.execute(
+            "UPDATE batches SET state = ?, error = NULL, updated = ? WHERE crawl_id = ? AND idx = ?",
+            (DONE, time.time(), self.crawl_id, idx),
+        )
+
+    def mark_failed(self, idx, error):
+        self.conn.execute(
+            "UPDATE batches SET state = ?, attempts = attempts + 1, error = ?, updated = ? WHERE crawl_id = ? AND idx = ?",
+            (FAILED, str(error)[:500], time.time(), self.crawl_id, idx),
+        )
+
+    def summary(self):
+        rows = self.conn.execute(
+            "SELECT state, COUNT(*) FROM batches WHERE crawl_id = ? GROUP BY state", (self.crawl_id,)
+        )
+        return {PENDING: 0, DONE: 0, FAILED: 0, **dict(rows)}
+
+
+def journal_path(output_path):
+    return output_path + JOURNAL_SUFFIX
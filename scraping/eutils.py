@@ -0,0 +1,226 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from common import metrics
+
+# Sovrascrivibile per puntare gli script a un server locale (es. bench/mock_eutils.py)
+EUTILS_URL = os.getenv("NCBI_EUTILS_URL", "https://eutils.ncbi.nlm.nih.gov/entrez/eutils").rstrip("/")
+ESEARCH_URL = f"{EUTILS_URL}/esearch.fcgi"
+EFETCH_URL = f"{EUTILS_URL}/efetch.fcgi"
+
+MAX_RETRIES = 5
+# Backoff esponenziale tra i retry: RETRY_BASE_DELAY * 2^tentativo secondi, al massimo RETRY_MAX_DELAY
+RETRY_BASE_DELAY = float(os.getenv("NCBI_RETRY_BASE_DELAY", 5))
+RETRY_MAX_DELAY = 60
+
+# Massimo numero di record per singola richiesta E-utilities (esearch / efetch uilist)
+HISTORY_PAGE_SIZE = 10000
+# esearch restituisce solo i primi 9.999 record di una query (retstart > 9998 → errore)
+MAX_ESARCH_RETMAX = 9999
+
+# Limiti NCBI: 3 richieste/s senza API key, 10 richieste/s con API key
+RATE_LIMIT_NO_KEY = 3
+RATE_LIMIT_WITH_KEY = 10
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (compatible; PubMedDownloader/1.0)"
+}
+
+
+class RateLimiter:
+    """
+    Token bucket thread-safe: al massimo `rate` richieste al secondo, con burst di `burst` richieste.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.capacity = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_time = (1 - self.tokens) / self.rate
+            time.sleep(wait_time)
+
+
+def rate_limit_for(api_key):
+    return RATE_LIMIT_WITH_KEY if api_key else RATE_LIMIT_NO_KEY
+
+
+class EUtilsClient:
+    """
+    Client E-utilities condiviso: sessione HTTP keep-alive con pool di connessioni,
+    rate limiter unico per tutte le richieste e retry con backoff esponenziale.
+    """
+
+    def __init__(self, api_key=None, workers=None, rate=None):
+        self.api_key = api_key
+        self.limiter = RateLimiter(rate or rate_limit_for(api_key))
+        # Con ~1 s di latenza per efetch servono circa `rate` richieste in volo per saturare il limite
+        self.workers = workers or rate_limit_for(api_key)
+
+        self.session = requests.Session()
+        self.session.headers.update(HEADERS)
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=self.workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        self.session.close()
+
+    def get(self, url, params, parse=None):
+        """
+        Esegue una GET rispettando il rate limit. Se `parse` è indicato viene applicato alla risposta
+        dentro il ciclo di retry (così anche una risposta malformata viene ritentata).
+        Solleva l'ultima eccezione dopo MAX_RETRIES tentativi.
+        """
+        return self._request("GET", url, params, parse)
+
+    def post(self, url, data, parse=None):
+        """
+        Come `get`, ma invia i parametri nel corpo: da usare per query o liste di ID lunghe.
+        """
+        return self._request("POST", url, data, parse)
+
+    def _request(self, method, url, params, parse):
+        params = dict(params)
+        if self.api_key:
+            params["api_key"] = self.api_key
+        key = "params" if method == "GET" else "data"
+        endpoint = url.rsplit("/", 1)[-1].split(".")[0]
+
+        retry_count = 0
+        while True:
+            with metrics.span("eutils_rate_limit_wait"):
+                self.limiter.acquire()
+            try:
+                # Rete e parsing misurati separatamente
+                with metrics.span("eutils_http", endpoint=endpoint):
+                    response = self.session.request(method, url, **{key: params})
+                    response.raise_for_status()
+                metrics.count("eutils_bytes", len(response.content), endpoint=endpoint)
+                return parse(response) if parse else response
+            except Exception as e:
+                metrics.count("eutils_retries", endpoint=endpoint)
+                retry_count += 1
+                if retry_count >= MAX_RETRIES:
+                    raise
+                wait_time = _retry_after(e) or min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** retry_count))
+                logging.warning(f"Error calling {url} ({retry_count}/{MAX_RETRIES}): {e}")
+                print(f"⚠️ Retry {retry_count}/{MAX_RETRIES} in {wait_time}s...")
+                time.sleep(wait_time)
+
+    def fetch_batches(self, batches, fetch, ordered=True):
+        """
+        Esegue `fetch(batch)` su più batch in parallelo, con al massimo `workers` richieste in volo.
+        Produce tuple (batch, risultato, errore): con `ordered=True` nello stesso ordine dei batch,
+        altrimenti appena ogni richiesta termina.
+        """
+        batches = iter(batches)
+        done_marker = object()
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            in_flight = deque()
+
+            def submit_next():
+                batch = next(batches, done_marker)
+                if batch is done_marker:
+                    return False
+                in_flight.append((batch, pool.submit(fetch, batch)))
+                return True
+
+            while len(in_flight) < self.workers and submit_next():
+                pass
+
+            while in_flight:
+                if ordered:
+                    batch, future = in_flight.popleft()
+                    future.exception()
+                else:
+                    done, _ = wait([f for _, f in in_flight], return_when=FIRST_COMPLETED)
+                    batch, future = next(item for item in in_flight if item[1] in done)
+                    in_flight.remove((batch, future))
+
+                submit_next()
+                error = future.exception()
+                yield batch, (None if error else future.result()), error
+
+
+def esearch_history(client, query):
+    """
+    Esegue la ricerca una sola volta sul server NCBI (usehistory=y) e ritorna il riferimento
+    al result set: {"count", "webenv", "query_key"}.
+    """
+    data = {
+        "db": "pubmed",
+        "term": query,
+        "usehistory": "y",
+        "retmax": 0,
+        "retmode": "json"
+    }
+    result = client.post(ESEARCH_URL, data, parse=lambda r: r.json())["esearchresult"]
+    return {
+        "count": int(result["count"]),
+        "webenv": result["webenv"],
+        "query_key": result["querykey"],
+    }
+
+
+def history_params(history):
+    return {"WebEnv": history["webenv"], "query_key": history["query_key"]}
+
+
+def fetch_history_ids(client, history, retmax=None):
+    """
+    Scarica i PMID del result set salvato sul server, a pagine di HISTORY_PAGE_SIZE (efetch uilist).
+    """
+    total = history["count"] if retmax is None else min(retmax, history["count"])
+    pmids = []
+    for retstart in range(0, total, HISTORY_PAGE_SIZE):
+        params = {
+            "db": "pubmed",
+            "rettype": "uilist",
+            "retmode": "text",
+            "retstart": retstart,
+            "retmax": min(HISTORY_PAGE_SIZE, total - retstart),
+            **history_params(history)
+        }
+        page = client.get(EFETCH_URL, params, parse=lambda r: r.text.split())
+        if not page:
+            break
+        pmids.extend(page)
+        print(f"✅ Fetched {len(pmids)} PMIDs so far...")
+        logging.info(f"Fetched {len(pmids)} PMIDs so far from history server")
+    return pmids[:total]
+
+
+def _retry_after(error):
+    # Su 429 NCBI può indicare quanto attendere
+    response = getattr(error, "response", None)
+    if response is None or response.status_code != 429:
+        return None
+    try:
+        return max(1, int(response.headers.get("Retry-After", "")))
+    except ValueError:
+        return None
@@ -1,15 +1,23 @@
-import requests
-import time
-import xml.etree.ElementTree as ET
-import json
 import os
 import argparse
 import logging
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from dotenv import load_dotenv
+
+# Prima degli import di eutils/metrics: NCBI_EUTILS_URL e METRICS_EXPORT vengono letti all'import
+load_dotenv()
+
+SCRAPING_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(SCRAPING_DIR, ".."))
+sys.path.insert(0, SCRAPING_DIR)
+from common import metrics  # noqa: E402
+from crawl_journal import CrawlJournal, journal_path  # noqa: E402
+from eutils import ESEARCH_URL, MAX_ESARCH_RETMAX, EUtilsClient, esearch_history, fetch_history_ids  # noqa: E402
+from pubmed_fetch import fetch_pubmed_details  # noqa: E402
 
-MAX_RETRIES = 5
 BATCH_SIZE = 100
-MAX_ESARCH_RETMAX = 20000  # limite esearch per singola query
 
 logging.basicConfig(
     filename="logs.txt",
@@ -18,16 +26,17 @@ logging.basicConfig(
     level=logging.INFO
 )
 
-HEADERS = {
-    "User-Agent": "Mozilla/5.0 (compatible; PubMedDownloader/1.0)"
-}
-
-
-def fetch_pubmed_ids(query, retmax=20000, api_key=None):
+@metrics.timed()
+def fetch_pubmed_ids(query, retmax=20000, api_key=None, client=None, use_history=False):
     """
-    Funzione standard esearch, fino a retmax <= 20000
+    Funzione standard esearch, fino a retmax <= 20000.
+    Con `use_history=True` la ricerca viene salvata sul server NCBI e gli ID letti a pagine da 10000.
     """
-    url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi"
+    client = client or EUtilsClient(api_key)
+    if use_history:
+        history = esearch_history(client, query)
+        return fetch_history_ids(client, history, retmax=retmax)
+
     pmids = []
     retstart = 0
 
@@ -39,192 +48,141 @@ def fetch_pubmed_ids(query, retmax=20000, api_key=None):
             "retstart": retstart,
             "retmode": "json"
         }
-        if api_key:
-            params["api_key"] = api_key
-
-        retry_count = 0
-        while retry_count < MAX_RETRIES:
-            try:
-                response = requests.get(url, params=params, headers=HEADERS)
-                response.raise_for_status()
-                data = response.json()
-                batch_pmids = data["esearchresult"]["idlist"]
-                if not batch_pmids:
-                    return pmids
-                pmids.extend(batch_pmids)
-                retstart += len(batch_pmids)
-                print(f"✅ Fetched {len(pmids)} PMIDs so far in current chunk...")
-                time.sleep(0.4)
-                break
-            except Exception as e:
-                retry_count += 1
-                wait_time = min(60, 5 * (2 ** retry_count))
-                logging.warning(f"Error fetching PMIDs ({retry_count}/{MAX_RETRIES}): {e}")
-                print(f"⚠️ Retry {retry_count}/{MAX_RETRIES} in {wait_time}s...")
-                time.sleep(wait_time)
-        if retry_count >= MAX_RETRIES:
-            logging.error(f"Max retries reached at retstart={retstart}")
+        try:
+            data = client.get(ESEARCH_URL, params, parse=lambda r: r.json())
+        except Exception as e:
+            logging.error(f"Max retries reached at retstart={retstart}: {e}")
             break
 
-    return pmids
-
-
-def fetch_pubmed_details(pmids, save_path="pubmed_articles.json", api_key=None):
-    url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi"
-    articles = []
-
-    if os.path.exists(save_path):
-        with open(save_path, "r", encoding="utf-8") as f:
-            articles = json.load(f)
-        already_fetched_pmids = set(a["pmid"] for a in articles)
-    else:
-        already_fetched_pmids = set()
-
-    for i in range(0, len(pmids), BATCH_SIZE):
-        batch_pmids = pmids[i:i + BATCH_SIZE]
-        batch_pmids = [pmid for pmid in batch_pmids if pmid not in already_fetched_pmids]
+        batch_pmids = data["esearchresult"]["idlist"]
         if not batch_pmids:
-            continue
+            return pmids
+        pmids.extend(batch_pmids)
+        retstart += len(batch_pmids)
+        print(f"✅ Fetched {len(pmids)} PMIDs so far in current chunk...")
+
+    return pmids
 
-        params = {
-            "db": "pubmed",
-            "retmode": "xml",
-            "id": ",".join(batch_pmids)
-        }
-        if api_key:
-            params["api_key"] = api_key
-
-        retry_count = 0
-        while retry_count < MAX_RETRIES:
-            try:
-                response = requests.get(url, params=params, headers=HEADERS)
-                response.raise_for_status()
-                root = ET.fromstring(response.text)
-
-                for article in root.findall(".//PubmedArticle"):
-                    art = {}
-                    medline = article.find("MedlineCitation")
-                    article_data = medline.find("Article")
-
-                    art["title"] = article_data.findtext("ArticleTitle") or ""
-
-                    abstract_text = ""
-                    abstract = article_data.find("Abstract")
-                    if abstract is not None:
-                        abstract_text = " ".join([t.text for t in abstract.findall("AbstractText") if t.text])
-                    art["abstract"] = abstract_text
-
-                    authors = []
-                    author_list = article_data.find("AuthorList")
-                    if author_list is not None:
-                        for author in author_list.findall("Author"):
-                            last = author.findtext("LastName") or ""
-                            first = author.findtext("ForeName") or ""
-                            full_name = (first + " " + last).strip()
-                            if full_name:
-                                authors.append(full_name)
-                    art["authors"] = authors
-
-                    pub_date = article_data.find("Journal/JournalIssue/PubDate")
-                    year = pub_date.findtext("Year") or ""
-                    month = pub_date.findtext("Month") or ""
-                    day = pub_date.findtext("Day") or ""
-                    art["pub_date"] = f"{year}-{month}-{day}"
-
-                    art["pmid"] = medline.findtext("PMID")
-
-                    articles.append(art)
-
-                logging.info(f"Fetched batch {i // BATCH_SIZE + 1}. Total articles: {len(articles)}")
-                with open(save_path, "w", encoding="utf-8") as f:
-                    json.dump(articles, f, ensure_ascii=False, indent=2)
-                time.sleep(0.5)
-                break
-            except Exception as e:
-                retry_count += 1
-                wait_time = min(60, 5 * (2 ** retry_count))
-                logging.warning(f"Error fetching details ({retry_count}/{MAX_RETRIES}): {e}")
-                print(f"⚠️ Retry {retry_count}/{MAX_RETRIES} in {wait_time}s...")
-                time.sleep(wait_time)
-
-        if retry_count >= MAX_RETRIES:
-            logging.error(f"Max retries reached at batch index {i}. Skipping batch.")
-            continue
 
-    return articles
+def date_filtered_query(query, start, end):
+    # Formatta filtro data in formato PubMed yyyy/mm/dd:yyyy/mm/dd
+    date_filter = f'("{start.strftime("%Y/%m/%d")}"[PDAT] : "{end.strftime("%Y/%m/%d")}"[PDAT])'
+    return f"{query} AND {date_filter}"
 
 
-def daterange(start_date, end_date, delta_days=30):
+def plan_date_partitions(query, start_date, end_date, client, limit=MAX_ESARCH_RETMAX):
     """
-    Genera intervalli temporali [start, start+delta_days) fino a end_date
+    Partiziona [start_date, end_date] in intervalli con al massimo `limit` risultati ciascuno.
+    Ogni intervallo troppo grande viene diviso a metà finché il conteggio scende sotto il limite
+    (i conteggi dello stesso livello vengono richiesti in parallelo); gli intervalli vuoti vengono scartati
+    e quelli adiacenti poco popolati vengono poi fusi in un'unica richiesta.
+    Ritorna una lista ordinata di tuple (start, end, count).
     """
-    current = start_date
-    while current < end_date:
-        yield current, min(current + timedelta(days=delta_days - 1), end_date)
-        current += timedelta(days=delta_days)
-
-
-def fetch_pubmed_ids_over_20000(query, start_year, end_year, api_key=None):
+    leaves = []
+    level = [(start_date, end_date)]
+
+    with ThreadPoolExecutor(max_workers=client.workers) as pool:
+        while level:
+            counts = pool.map(lambda r: get_pubmed_count(date_filtered_query(query, *r), client=client), level)
+            next_level = []
+            for (start, end), count in zip(level, counts):
+                if count == 0:
+                    continue
+                if count <= limit:
+                    leaves.append((start, end, count))
+                elif start >= end:
+                    # Un singolo giorno oltre il limite non si può dividere ulteriormente per data
+                    print(f"⚠️ Warning: {count} results on {start.strftime('%Y-%m-%d')}, only {limit} will be fetched.")
+                    logging.warning(f"{count} results on single day {start}, truncated to {limit}")
+                    leaves.append((start, end, count))
+                else:
+                    mid = start + timedelta(days=(end - start).days // 2)
+                    next_level.append((start, mid))
+                    next_level.append((mid + timedelta(days=1), end))
+            level = next_level
+
+    leaves.sort()
+    partitions = []
+    for start, end, count in leaves:
+        if partitions and partitions[-1][2] + count <= limit:
+            prev_start, _, prev_count = partitions[-1]
+            partitions[-1] = (prev_start, end, prev_count + count)
+        else:
+            partitions.append((start, end, count))
+    return partitions
+
+
+def fetch_pubmed_ids_over_20000(query, start_year, end_year, api_key=None, client=None, use_history=False, journal=None):
     """
     Suddivide la ricerca in intervalli di tempo per aggirare limite 20k record.
-    Usa intervalli di 30 giorni di default (parametrizzabile).
+    Gli intervalli sono calcolati in modo adattivo da `plan_date_partitions`.
+    Con `journal` il piano e i PMID di ogni intervallo sono salvati man mano: alla ripresa
+    si riscaricano solo gli intervalli non completati.
     """
+    client = client or EUtilsClient(api_key)
     all_pmids = []
 
     start_date = datetime(year=start_year, month=1, day=1)
     end_date = datetime(year=end_year, month=12, day=31)
 
-    for (start, end) in daterange(start_date, end_date, delta_days=30):
-        # Formatta filtro data in formato PubMed yyyy/mm/dd:yyyy/mm/dd
-        date_filter = f'("{start.strftime("%Y/%m/%d")}"[PDAT] : "{end.strftime("%Y/%m/%d")}"[PDAT])'
-        combined_query = f"{query} AND {date_filter}"
-
-        print(f"🔍 Fetching PMIDs for interval {start.strftime('%Y-%m-%d')} to {end.strftime('%Y-%m-%d')}...")
-        logging.info(f"Fetching PMIDs for interval {start} to {end}")
+    saved = journal.partitions() if journal else None
+    if saved is None:
+        partitions = plan_date_partitions(query, start_date, end_date, client)
+        done = [False] * len(partitions)
+        if journal:
+            journal.save_partitions([(s.date().isoformat(), e.date().isoformat(), c) for s, e, c in partitions])
+        print(f"🗂️ {len(partitions)} date partitions planned")
+    else:
+        partitions = [(datetime.fromisoformat(s), datetime.fromisoformat(e), c) for s, e, c, _ in saved]
+        done = [d for *_, d in saved]
+        print(f"♻️ Resuming crawl: {sum(done)}/{len(partitions)} date partitions already fetched")
+    logging.info(f"Planned {len(partitions)} date partitions: {[(str(s.date()), str(e.date()), c) for s, e, c in partitions]}")
 
-        # Chiediamo quanti risultati ci sono (max 20000)
-        count = get_pubmed_count(combined_query, api_key)
-        if count == 0:
+    for i, (start, end, count) in enumerate(partitions):
+        if done[i]:
             continue
+        print(f"🔍 Fetching {count} PMIDs for interval {start.strftime('%Y-%m-%d')} to {end.strftime('%Y-%m-%d')}...")
+        logging.info(f"Fetching PMIDs for interval {start} to {end}")
 
-        if count > MAX_ESARCH_RETMAX:
-            print(f"⚠️ Warning: More than {MAX_ESARCH_RETMAX} results in this interval, consider reducing interval size.")
-            logging.warning(f"More than {MAX_ESARCH_RETMAX} results in interval {start} to {end}")
-
-        # Fetch fino a max 20000 in questo intervallo
-        pmids = fetch_pubmed_ids(combined_query, retmax=min(count, MAX_ESARCH_RETMAX), api_key=api_key)
+        # Fetch fino a max MAX_ESARCH_RETMAX in questo intervallo
+        retmax = min(count, MAX_ESARCH_RETMAX)
+        pmids = fetch_pubmed_ids(date_filtered_query(query, start, end), retmax=retmax,
+                                 client=client, use_history=use_history)
         all_pmids.extend(pmids)
+        if journal:
+            # Un intervallo incompleto (esearch fallito a metà) verrà riscaricato alla prossima esecuzione
+            journal.save_pmids(pmids, partition=i, done=len(pmids) >= retmax)
+
+    if journal:
+        all_pmids = journal.pmids()
 
-    # Rimuove duplicati, se presenti
-    unique_pmids = list(set(all_pmids))
+    # Rimuove duplicati, se presenti, mantenendo l'ordine
+    unique_pmids = list(dict.fromkeys(all_pmids))
     print(f"✅ Total PMIDs fetched overall: {len(unique_pmids)}")
     logging.info(f"Total PMIDs fetched overall: {len(unique_pmids)}")
     return unique_pmids
 
 
-def get_pubmed_count(query, api_key=None):
+def get_pubmed_count(query, api_key=None, client=None):
     """
     Funzione per ottenere il numero totale di risultati per una query esearch
     """
-    url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi"
+    client = client or EUtilsClient(api_key)
     params = {
         "db": "pubmed",
         "term": query,
         "retmode": "json",
         "retmax": 0
     }
-    if api_key:
-        params["api_key"] = api_key
 
     try:
-        response = requests.get(url, params=params, headers=HEADERS)
-        response.raise_for_status()
-        data = response.json()
+        data = client.get(ESEARCH_URL, params, parse=lambda r: r.json())
         count = int(data["esearchresult"]["count"])
         return count
     except Exception as e:
+        # Non ritorniamo 0: un intervallo verrebbe scartato in silenzio
         logging.error(f"Error getting count for query {query}: {e}")
-        return 0
+        raise
 
 
 def main():
@@ -232,19 +190,38 @@ def main():
     parser.add_argument("--query", required=True, help="Search query")
     parser.add_argument("--start_year", type=int, required=True, help="Start year for date partitioning")
     parser.add_argument("--end_year", type=int, required=True, help="End year for date partitioning")
-    parser.add_argument("--output", default="pubmed_articles.json", help="Output file path")
-    parser.add_argument("--api_key", help="NCBI API key (optional)")
+    parser.add_argument("--output", default="pubmed_articles.jsonl", help="Output file path (JSONL)")
+    parser.add_argument("--api_key", help="NCBI API key (optional, default: NCBI_API_KEY from .env)")
+    parser.add_argument("--workers", type=int, default=None, help="Parallel efetch requests (default: NCBI rate limit)")
+    parser.add_argument("--unordered", action="store_true", help="Write batches as they arrive instead of in PMID order")
+    parser.add_argument("--use-history", action="store_true", help="Use the E-utilities history server for PMID paging")
+    parser.add_argument("--no-journal", action="store_true", help="Disable the crawl journal (<output>.journal) used for resume")
     args = parser.parse_args()
 
     print(f"🔍 Searching PubMed for: \"{args.query}\" from {args.start_year} to {args.end_year}")
     logging.info(f"Started query: {args.query} from {args.start_year} to {args.end_year}")
 
-    pmids = fetch_pubmed_ids_over_20000(args.query, args.start_year, args.end_year, api_key=args.api_key)
-    print(f"📥 Fetched {len(pmids)} PMIDs. Getting article details...")
+    journal = None
+    if not args.no_journal:
+        signature = {"script": "pubmed-scrape-api-big-data", "query": args.query,
+                     "start_year": args.start_year, "end_year": args.end_year}
+        journal = CrawlJournal(journal_path(args.output), signature)
+        if journal.restarted:
+            print(f"🔄 Previous crawl in {journal.path} was complete: starting a new one")
 
-    articles = fetch_pubmed_details(pmids, save_path=args.output, api_key=args.api_key)
-    print(f"✅ Done. Saved {len(articles)} articles to {args.output}")
-    logging.info(f"Completed. Saved {len(articles)} articles.")
+    try:
+        with EUtilsClient(args.api_key or os.getenv("NCBI_API_KEY"), workers=args.workers) as client:
+            pmids = fetch_pubmed_ids_over_20000(args.query, args.start_year, args.end_year, client=client,
+                                                use_history=args.use_history, journal=journal)
+            print(f"📥 Fetched {len(pmids)} PMIDs. Getting article details...")
+
+            total = fetch_pubmed_details(pmids, save_path=args.output, client=client, ordered=not args.unordered,
+                                         journal=journal)
+    finally:
+        if journal:
+            journal.close()
+    print(f"✅ Done. Saved {total} articles to {args.output}")
+    logging.info(f"Completed. Saved {total} articles.")
 
 
 if __name__ == "__main__":
@@ -1,15 +1,18 @@
-import requests
-import time
-import xml.etree.ElementTree as ET
 import json
 import os
 from dotenv import load_dotenv
 import argparse
 import logging
+import sys
 
 load_dotenv()
 
-MAX_RETRIES = 5
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common import metrics  # noqa: E402
+from crawl_journal import CrawlJournal, journal_path  # noqa: E402
+from eutils import ESEARCH_URL, MAX_ESARCH_RETMAX, EUtilsClient, esearch_history, fetch_history_ids  # noqa: E402
+from pubmed_fetch import HISTORY_BATCH_SIZE, fetch_pubmed_details  # noqa: E402
+
 BATCH_SIZE = 100
 
 # Logging
@@ -20,157 +23,70 @@ logging.basicConfig(
     level=logging.INFO
 )
 
-HEADERS = {
-    "User-Agent": "Mozilla/5.0 (compatible; PubMedDownloader/1.0)"
-}
-
 
-def fetch_pubmed_ids(query, retmax=20000, api_key=None):
-    url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi"
+@metrics.timed()
+def fetch_pubmed_ids(query, retmax=20000, api_key=None, client=None, journal=None):
+    client = client or EUtilsClient(api_key)
     pmids = []
     retstart = 0
+    complete = True
+    # Oltre i primi MAX_ESARCH_RETMAX record esearch risponde con un errore: la lista si ferma lì
+    limit = min(retmax, MAX_ESARCH_RETMAX)
 
-    while retstart < retmax:
+    while retstart < limit:
         params = {
             "db": "pubmed",
             "term": query,
-            "retmax": min(BATCH_SIZE, retmax - retstart),
+            "retmax": min(BATCH_SIZE, limit - retstart),
             "retstart": retstart,
             "retmode": "json"
         }
-        if api_key:
-            params["api_key"] = api_key
-
-        retry_count = 0
-        while retry_count < MAX_RETRIES:
-            try:
-                response = requests.get(url, params=params, headers=HEADERS)
-                response.raise_for_status()
-                try:
-                    data = response.json()
-                except json.JSONDecodeError as e:
-                    logging.error(f"Invalid JSON at retstart={retstart}. Response preview: {response.text[:500]}")
-                    raise e
-
-                batch_pmids = data["esearchresult"]["idlist"]
-                if not batch_pmids:
-                    logging.info("No more PMIDs found.")
-                    return pmids
-
-                pmids.extend(batch_pmids)
-                retstart += len(batch_pmids)
-                print(f"✅ Fetched {len(pmids)} PMIDs so far...")
-                logging.info(f"Fetched {len(pmids)} PMIDs so far")
-                time.sleep(0.4)
-                break
-            except Exception as e:
-                retry_count += 1
-                wait_time = min(60, 5 * (2 ** retry_count))
-                logging.warning(f"Error fetching PMIDs ({retry_count}/{MAX_RETRIES}): {e}")
-                print(f"⚠️ Retry {retry_count}/{MAX_RETRIES} in {wait_time}s...")
-                time.sleep(wait_time)
-
-        if retry_count >= MAX_RETRIES:
-            logging.error(f"Max retries reached at retstart={retstart}")
+
+        try:
+            data = client.get(ESEARCH_URL, params, parse=_parse_esearch_json)
+        except Exception as e:
+            logging.error(f"Max retries reached at retstart={retstart}: {e}")
+            complete = False
             break
 
-    return pmids
+        batch_pmids = data["esearchresult"]["idlist"]
+        if not batch_pmids:
+            logging.info("No more PMIDs found.")
+            break
 
+        pmids.extend(batch_pmids)
+        retstart += len(batch_pmids)
+        print(f"✅ Fetched {len(pmids)} PMIDs so far...")
+        logging.info(f"Fetched {len(pmids)} PMIDs so far")
 
-def fetch_pubmed_details(pmids, save_path="pubmed_articles.json", api_key=None):
-    url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi"
-    articles = []
+    if complete and retmax > limit and len(pmids) >= limit:
+        print(f"⚠️ Warning: esearch returns only the first {limit} results, use --use-history or the big-data script for more.")
+        logging.warning(f"Query {query!r} truncated to the first {limit} esearch results")
 
-    if os.path.exists(save_path):
-        with open(save_path, "r", encoding="utf-8") as f:
-            articles = json.load(f)
-        already_fetched_pmids = set(a["pmid"] for a in articles)
-    else:
-        already_fetched_pmids = set()
+    if journal:
+        # Lista incompleta (esearch fallito a metà): alla prossima esecuzione la ricerca viene rifatta
+        journal.save_pmids(pmids, done=complete)
+    return pmids
 
-    for i in range(0, len(pmids), BATCH_SIZE):
-        batch_pmids = pmids[i:i + BATCH_SIZE]
-        batch_pmids = [pmid for pmid in batch_pmids if pmid not in already_fetched_pmids]
-        if not batch_pmids:
-            continue
 
-        params = {
-            "db": "pubmed",
-            "retmode": "xml",
-            "id": ",".join(batch_pmids)
-        }
-        if api_key:
-            params["api_key"] = api_key
-
-        retry_count = 0
-        while retry_count < MAX_RETRIES:
-            try:
-                response = requests.get(url, params=params, headers=HEADERS)
-                response.raise_for_status()
-                try:
-                    root = ET.fromstring(response.text)
-                except ET.ParseError as e:
-                    logging.error(f"XML parse error at batch {i}. Response: {response.text[:500]}")
-                    raise e
-
-                for article in root.findall(".//PubmedArticle"):
-                    art = {}
-                    medline = article.find("MedlineCitation")
-                    article_data = medline.find("Article")
-
-                    art["title"] = article_data.findtext("ArticleTitle") or ""
-
-                    abstract_text = ""
-                    abstract = article_data.find("Abstract")
-                    if abstract is not None:
-                        abstract_text = " ".join([t.text for t in abstract.findall("AbstractText") if t.text])
-                    art["abstract"] = abstract_text
-
-                    authors = []
-                    author_list = article_data.find("AuthorList")
-                    if author_list is not None:
-                        for author in author_list.findall("Author"):
-                            last = author.findtext("LastName") or ""
-                            first = author.findtext("ForeName") or ""
-                            full_name = (first + " " + last).strip()
-                            if full_name:
-                                authors.append(full_name)
-                    art["authors"] = authors
-
-                    pub_date = article_data.find("Journal/JournalIssue/PubDate")
-                    year = pub_date.findtext("Year") or ""
-                    month = pub_date.findtext("Month") or ""
-                    day = pub_date.findtext("Day") or ""
-                    art["pub_date"] = f"{year}-{month}-{day}"
-
-                    art["pmid"] = medline.findtext("PMID")
-
-                    articles.append(art)
-
-                logging.info(f"Fetched batch {i // BATCH_SIZE + 1}. Total articles: {len(articles)}")
-                with open(save_path, "w", encoding="utf-8") as f:
-                    json.dump(articles, f, ensure_ascii=False, indent=2)
-                time.sleep(0.5)
-                break
-            except Exception as e:
-                retry_count += 1
-                wait_time = min(60, 5 * (2 ** retry_count))
-                logging.warning(f"Error fetching details ({retry_count}/{MAX_RETRIES}): {e}")
-                print(f"⚠️ Retry {retry_count}/{MAX_RETRIES} in {wait_time}s...")
-                time.sleep(wait_time)
-
-        if retry_count >= MAX_RETRIES:
-            logging.error(f"Max retries reached at batch index {i}. Skipping batch.")
-            continue
-
-    return articles
+def _parse_esearch_json(response):
+    try:
+        return response.json()
+    except json.JSONDecodeError as e:
+        logging.error(f"Invalid JSON from esearch. Response preview: {response.text[:500]}")
+        raise e
 
 
 def main():
     parser = argparse.ArgumentParser(description="Massive PubMed downloader")
     parser.add_argument("--query", default="cancer immunotherapy clinical trial", help="Search query")
     parser.add_argument("--retmax", type=int, default=20000, help="Max number of records to fetch")
-    parser.add_argument("--output", default="pubmed_articles.json", help="Output file path")
+    parser.add_argument("--output", default="pubmed_articles.jsonl", help="Output file path (JSONL)")
+    parser.add_argument("--workers", type=int, default=None, help="Parallel efetch requests (default: NCBI rate limit)")
+    parser.add_argument("--unordered", action="store_true", help="Write batches as they arrive instead of in PMID order")
+    parser.add_argument("--use-history", action="store_true", help="Use the E-utilities history server (WebEnv/query_key)")
+    parser.add_argument("--history-batch-size", type=int, default=HISTORY_BATCH_SIZE, help="Articles per efetch in history mode")
+    parser.add_argument("--no-journal", action="store_true", help="Disable the crawl journal (<output>.journal) used for resume")
     # parser.add_argument("--api_key", help="NCBI API key (optional)")
 
     args = parser.parse_args()
@@ -183,12 +99,38 @@ def main():
     print(f"🔍 Searching PubMed for: \"{args.query}\" (max {args.retmax} results)")
     logging.info(f"Started query: {args.query} with retmax={args.retmax}")
 
-    pmids = fetch_pubmed_ids(args.query, retmax=args.retmax, api_key=api_key)
-    print(f"📥 Fetched {len(pmids)} PMIDs. Getting article details...")
-
-    articles = fetch_pubmed_details(pmids, save_path=args.output, api_key=api_key)
-    print(f"✅ Done. Saved {len(articles)} articles to {args.output}")
-    logging.info(f"Completed. Saved {len(articles)} articles.")
+    journal = None
+    if not args.no_journal:
+        signature = {"script": "pubmed-scrape-api", "query": args.query, "retmax": args.retmax}
+        journal = CrawlJournal(journal_path(args.output), signature)
+        if journal.restarted:
+            print(f"🔄 Previous crawl in {journal.path} was complete: starting a new one")
+
+    try:
+        with EUtilsClient(api_key, workers=args.workers) as client:
+            history = None
+            if journal and journal.pmids_complete():
+                # Ripresa: lista dei PMID dal journal, senza rifare esearch (gli efetch vanno per ID)
+                pmids = journal.pmids()
+                print(f"♻️ Resuming crawl with {len(pmids)} PMIDs from {journal.path}")
+            else:
+                if args.use_history:
+                    history = esearch_history(client, args.query)
+                    logging.info(f"History server: {history['count']} results, query_key={history['query_key']}")
+                    pmids = fetch_history_ids(client, history, retmax=args.retmax)
+                    if journal:
+                        journal.save_pmids(pmids)
+                else:
+                    pmids = fetch_pubmed_ids(args.query, retmax=args.retmax, client=client, journal=journal)
+            print(f"📥 Fetched {len(pmids)} PMIDs. Getting article details...")
+
+            total = fetch_pubmed_details(pmids, save_path=args.output, client=client, ordered=not args.unordered,
+                                         history=history, history_batch_size=args.history_batch_size, journal=journal)
+    finally:
+        if journal:
+            journal.close()
+    print(f"✅ Done. Saved {total} articles to {args.output}")
+    logging.info(f"Completed. Saved {total} articles.")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,105 @@
+import logging
+
+from common import metrics
+from common.article_store import ArticleStore
+from crawl_journal import FAILED, PENDING
+from eutils import EFETCH_URL, EUtilsClient, history_params
+from pubmed_parser import parse_pubmed_xml
+
+BATCH_SIZE = 100
+HISTORY_BATCH_SIZE = 500  # articoli per efetch quando si legge dal history server
+
+
+@metrics.timed()
+def fetch_pubmed_details(pmids, save_path="pubmed_articles.jsonl", api_key=None, client=None, ordered=True,
+                         history=None, history_batch_size=HISTORY_BATCH_SIZE, journal=None):
+    """
+    Scarica i dettagli degli articoli e li accoda a `save_path` (JSONL append-only).
+    I batch vengono richiesti in parallelo tramite `EUtilsClient` e scritti da un solo writer;
+    con `ordered=False` vengono scritti nell'ordine di arrivo.
+    Se `history` (vedi `esearch_history`) è indicato, `pmids` deve essere il result set nello stesso ordine
+    del server: gli articoli vengono letti per posizione (retstart/retmax) senza inviare la lista degli ID.
+    I PMID già presenti nell'archivio vengono saltati. I batch falliti dopo MAX_RETRIES vengono ritentati
+    alla fine; con `journal` (vedi `CrawlJournal`) lo stato di ogni batch è persistente, quindi i batch completati
+    non vengono più richiesti e quelli ancora falliti restano in coda per l'esecuzione successiva.
+    Ritorna il numero totale di articoli salvati.
+    """
+    client = client or EUtilsClient(api_key)
+    batch_size = history_batch_size if history else BATCH_SIZE
+
+    with ArticleStore(save_path) as store:
+        if journal:
+            journal.plan_batches(pmids, batch_size)
+            planned = journal.batches(PENDING) + journal.batches(FAILED)
+        else:
+            planned = [(n, i, pmids[i:i + batch_size]) for n, i in enumerate(range(0, len(pmids), batch_size))]
+
+        batches = []
+        for idx, retstart, batch_pmids in planned:
+            batch_pmids = [pmid for pmid in batch_pmids if pmid not in store]
+            if batch_pmids:
+                batches.append((idx, retstart, batch_pmids))
+            elif journal:
+                journal.mark_done(idx)
+
+        def fetch(batch):
+            idx, retstart, batch_pmids = batch
+            if history:
+                # Finestra del result set sul server: eventuali articoli già salvati vengono scartati in scrittura
+                params = {
+                    "db": "pubmed",
+                    "retmode": "xml",
+                    "retstart": retstart,
+                    "retmax": min(batch_size, len(pmids) - retstart),
+                    **history_params(history)
+                }
+                return client.get(EFETCH_URL, params, parse=parse_pubmed_articles)
+            data = {
+                "db": "pubmed",
+                "retmode": "xml",
+                "id": ",".join(batch_pmids)
+            }
+            # POST: con 100 PMID l'URL diventerebbe troppo lungo
+            return client.post(EFETCH_URL, data, parse=parse_pubmed_articles)
+
+        def download(batches):
+            failed = []
+            for n, (batch, articles, error) in enumerate(client.fetch_batches(batches, fetch, ordered=ordered), 1):
+                idx, retstart, batch_pmids = batch
+                if error:
+                    logging.error(f"Max retries reached for batch at index {retstart} (first PMID {batch_pmids[0]}): "
+                                  f"{error}. Batch queued for retry.")
+                    failed.append(batch)
+                    if journal:
+                        journal.mark_failed(idx, error)
+                    continue
+                with metrics.span("store_append"):
+                    saved = store.append_batch(articles)
+                metrics.count("articles_saved", saved)
+                # Il batch è segnato completato solo dopo che gli articoli sono su disco
+                if journal:
+                    journal.mark_done(idx)
+                logging.info(f"Fetched batch {n}/{len(batches)}. Total articles: {len(store)}")
+            return failed
+
+        failed = download(batches)
+        if failed:
+            # Coda dei falliti: un secondo giro alla fine, quando gli errori transitori sono probabilmente passati
+            print(f"🔁 Retrying {len(failed)} failed batches...")
+            failed = download(failed)
+        if failed:
+            lost = sum(len(batch_pmids) for _, _, batch_pmids in failed)
+            print(f"⚠️ {len(failed)} batches ({lost} articles) still failing" + (", queued for the next run" if journal else ""))
+            logging.error(f"{len(failed)} batches ({lost} articles) still failing after retry")
+
+        return len(store)
+
+
+@metrics.timed("parse_xml")
+def parse_pubmed_articles(response):
+    # Parsing in streaming direttamente dai bytes della risposta (senza decodificarla in str)
+    try:
+        return parse_pubmed_xml(response.content)
+    except SyntaxError as e:
+        logging.error(f"XML parse error. Response: {response.content[:500]!r}")
+        raise e
@@ -0,0 +1,136 @@
+import io
+from dataclasses import asdict, dataclass, field
+
+try:
+    from lxml import etree
+    HAS_LXML = True
+except ImportError:  # fallback sulla libreria standard (più lenta, stessa API iterparse)
+    import xml.etree.ElementTree as etree
+    HAS_LXML = False
+
+
+@dataclass
+class PubmedRecord:
+    """
+    Record compatto di un articolo PubMed. I primi cinque campi sono quelli storici del JSON,
+    gli altri sono metadati aggiuntivi estratti dallo stesso XML.
+    """
+    pmid: str = ""
+    title: str = ""
+    abstract: str = ""
+    authors: list = field(default_factory=list)
+    pub_date: str = ""
+    journal: str = ""
+    doi: str = ""
+    mesh_terms: list = field(default_factory=list)
+    publication_types: list = field(default_factory=list)
+    # Abstract strutturati: [{"label": "METHODS", "text": "..."}]; label vuota se non strutturato
+    abstract_sections: list = field(default_factory=list)
+
+    def to_dict(self):
+        return asdict(self)
+
+
+def iter_pubmed_records(source):
+    """
+    Legge un documento efetch (bytes o file binario) in streaming e produce un `PubmedRecord`
+    per ogni `PubmedArticle`, liberando la memoria dell'elemento appena elaborato.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+
+    if HAS_LXML:
+        context = etree.iterparse(source, events=("end",), tag="PubmedArticle", resolve_entities=False, huge_tree=True)
+    else:
+        context = etree.iterparse(source, events=("end",))
+
+    for _, elem in context:
+        if elem.tag != "PubmedArticle":
+            continue
+        record = _parse_article(elem)
+        elem.clear()
+        if HAS_LXML:
+            # Rimuove anche i fratelli già elaborati, che altrimenti restano attaccati alla radice
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
+        if record is not None:
+            yield record
+
+
+def parse_pubmed_xml(content):
+    """
+    Ritorna la lista degli articoli (dict) contenuti in una risposta efetch.
+    """
+    return [record.to_dict() for record in iter_pubmed_records(content)]
+
+
+def _parse_article(elem):
+    medline = elem.find("MedlineCitation")
+    if medline is None:
+        return None
+    article = medline.find("Article")
+    if article is None:
+        return None
+
+    record = PubmedRecord(pmid=medline.findtext("PMID") or "")
+    record.title = _text(article.find("ArticleTitle"))
+
+    abstract = article.find("Abstract")
+    if abstract is not None:
+        for part in abstract.iterfind("AbstractText"):
+            text = _text(part)
+            if text:
+                record.abstract_sections.append({"label": part.get("Label") or "", "text": text})
+        record.abstract = " ".join(s["text"] for s in record.abstract_sections)
+
+    author_list = article.find("AuthorList")
+    if author_list is not None:
+        for author in author_list.iterfind("Author"):
+            last = author.findtext("LastName") or ""
+            first = author.findtext("ForeName") or ""
+            full_name = (first + " " + last).strip()
+            if full_name:
+                record.authors.append(full_name)
+
+    journal = article.find("Journal")
+    if journal is not None:
+        record.journal = journal.findtext("Title") or ""
+        pub_date = journal.find("JournalIssue/PubDate")
+        if pub_date is not None:
+            year = pub_date.findtext("Year") or ""
+            month = pub_date.findtext("Month") or ""
+            day = pub_date.findtext("Day") or ""
+            if year:
+                record.pub_date = f"{year}-{month}-{day}"
+            else:
+                # Date non strutturate, es. "1998 Dec-1999 Jan"
+                record.pub_date = pub_date.findtext("MedlineDate") or "--"
+
+    record.doi = _find_doi(elem, article)
+
+    for descriptor in medline.iterfind("MeshHeadingList/MeshHeading/DescriptorName"):
+        if descriptor.text:
+            record.mesh_terms.append(descriptor.text)
+
+    for pub_type in article.iterfind("PublicationTypeList/PublicationType"):
+        if pub_type.text:
+            record.publication_types.append(pub_type.text)
+
+    return record
+
+
+def _find_doi(elem, article):
+    for article_id in elem.iterfind("PubmedData/ArticleIdList/ArticleId"):
+        if article_id.get("IdType") == "doi" and article_id.text:
+            return article_id.text.strip()
+    for location in article.iterfind("ELocationID"):
+        if location.get("EIdType") == "doi" and location.text:
+            return location.text.strip()
+    return ""
+
+
+def _text(elem):
+    # itertext include anche il testo dentro markup inline (<i>, <sup>, ...) che findtext perderebbe
+    if elem is None:
+        return ""
+    return "".join(elem.itertext()).strip()
@@ -0,0 +1,79 @@
+import threading
+import time
+
+import numpy as np
+
+DEFAULT_MAX_ENTRIES = 1000
+DEFAULT_TTL = 24 * 3600  # secondi
+DEFAULT_THRESHOLD = 0.95  # similarità coseno minima tra le domande
+
+
+class AnswerCache:
+    """
+    Cache semantica delle risposte LLM, in memoria.
+
+    Una risposta viene riusata se la nuova domanda ha similarità coseno ≥ `threshold` con una domanda
+    già risposta e la ricerca ha restituito lo stesso insieme di PMID (stesso contesto per l'LLM).
+    Le voci scadono dopo `ttl` secondi; oltre `max_entries` si scarta quella usata meno di recente.
+    Tutta la cache viene svuotata quando cambia il fingerprint della collection (nuovo caricamento).
+    """
+
+    def __init__(self, dim, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL, threshold=DEFAULT_THRESHOLD):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self.lock = threading.Lock()
+        self.vectors = np.zeros((max_entries, dim), dtype=np.float32)
+        self.entries = [None] * max_entries  # (pmids, answer, created)
+        self.last_used = np.zeros(max_entries, dtype=np.float64)
+        self.fingerprint = None
+        self.hits = 0
+        self.misses = 0
+
+    def _check_fingerprint(self, fingerprint):
+        if fingerprint != self.fingerprint:
+            self.entries = [None] * self.max_entries
+            self.last_used[:] = 0
+            self.fingerprint = fingerprint
+
+    @staticmethod
+    def _normalize(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get(self, query_vector, pmids, fingerprint=None):
+        pmids = frozenset(pmids)
+        now = time.time()
+        with self.lock:
+            self._check_fingerprint(fingerprint)
+            scores = self.vectors @ self._normalize(query_vector)
+            for slot in np.argsort(-scores):
+                if scores[slot] < self.threshold:
+                    break
+                entry = self.entries[slot]
+                if entry is None:
+                    continue
+                if now - entry[2] > self.ttl:
+                    self.entries[slot] = None
+                    self.last_used[slot] = 0
+                    continue
+                if entry[0] == pmids:
+                    self.last_used[slot] = now
+                    self.hits += 1
+                    return entry[1]
+            self.misses += 1
+            return None
+
+    def put(self, query_vector, pmids, answer, fingerprint=None):
+        now = time.time()
+        with self.lock:
+            self._check_fingerprint(fingerprint)
+            # Slot libero se c'è, altrimenti quello usato meno di recente
+            slot = int(np.argmin(self.last_used))
+            self.vectors[slot] = self._normalize(query_vector)
+            self.entries[slot] = (frozenset(pmids), answer, now)
+            self.last_used[slot] = now
+
+    def __len__(self):
+        return sum(entry is not None for entry in self.entries)
@@ -0,0 +1,70 @@
+import re
+from functools import lru_cache
+
+DEFAULT_TOKEN_BUDGET = 1500
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9(\[])")
+
+
+@lru_cache(maxsize=None)
+def _encoding():
+    try:
+        import tiktoken
+    except ImportError:  # stima approssimata: ~4 caratteri per token in inglese
+        return None
+    return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text):
+    encoding = _encoding()
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text))
+
+
+def split_sentences(text):
+    return [s for s in _SENTENCE_RE.split(text.strip()) if s]
+
+
+def pack_documents(docs, budget=DEFAULT_TOKEN_BUDGET):
+    """
+    Seleziona i documenti da passare all'LLM entro `budget` token.
+    I documenti vengono deduplicati (stesso PMID o stesso testo) e presi in ordine di score:
+    i più rilevanti entrano interi, quando il budget non basta l'abstract viene tagliato a frasi intere
+    e i documenti che non ci stanno nemmeno con il titolo e una frase vengono scartati.
+    """
+    from langchain.schema import Document
+
+    ordered = sorted(docs, key=lambda d: d.metadata.get("score") or 0.0, reverse=True)
+    seen = set()
+    packed = []
+    remaining = budget
+    for doc in ordered:
+        meta = doc.metadata or {}
+        key = meta.get("pmid") or " ".join(doc.page_content.lower().split())
+        if key in seen:
+            continue
+        seen.add(key)
+
+        cost = count_tokens(doc.page_content)
+        if cost <= remaining:
+            packed.append(doc)
+            remaining -= cost
+            continue
+
+        # Taglio a livello di frase dell'abstract (il titolo resta sempre intero)
+        title = meta.get("title", "")
+        sentences = split_sentences(meta.get("abstract", ""))
+        kept = []
+        used = count_tokens(title)
+        for sentence in sentences:
+            sentence_cost = count_tokens(sentence) + 1
+            if used + sentence_cost > remaining:
+                break
+            kept.append(sentence)
+            used += sentence_cost
+        if kept:
+            content = "\n\n".join(part for part in (title, " ".join(kept)) if part)
+            packed.append(Document(page_content=content, metadata={**meta, "trimmed": True}))
+            remaining -= used
+    return packed
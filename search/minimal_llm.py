@@ -1,38 +1,245 @@
+import argparse
 import os
+import sys
+import threading
+import time
+from functools import lru_cache
 from dotenv import load_dotenv
-from qdrant_client import QdrantClient
-from langchain.schema import Document
-from langchain.chat_models import ChatOpenAI
-from langchain.chains.question_answering import load_qa_chain
-from langchain.embeddings import HuggingFaceEmbeddings  # o OpenAIEmbeddings
-from langchain.vectorstores import Qdrant
 
 load_dotenv()
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common import metrics  # noqa: E402
+
+# LangChain, HuggingFace, OpenAI e il modello di embedding vengono importati/caricati solo al primo uso
+# (getter qui sotto) e poi restano residenti: in modalità interattiva l'avvio si paga una volta sola.
+
+# "qdrant" (server) oppure "local": indice locale scritto da pubmed_to_qdrant.py --backend local
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "qdrant")
+LOCAL_STORE_DIR = os.getenv("LOCAL_STORE_DIR", "local_vector_store")
+
 QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
 QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
 COLLECTION_NAME = "pubmed_articles"
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
-client = QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY)
-
 # Usa modello embedding per trasformare testo in vettore
-embedding_model = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-
-def search_qdrant(question, limit=5):
-    query_vector = embedding_model.embed_query(question)
-    search_result = client.search(
-        collection_name=COLLECTION_NAME,
-        query_vector=query_vector,
-        limit=limit,
-        with_payload=True
-    )
-    return search_result
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+
+# Stessa cache su disco usata da pubmed_to_qdrant.py (opzionale)
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR")
+
+# Docstore locale scritto da pubmed_to_qdrant.py --docstore: titolo e abstract non sono nel payload Qdrant
+DOCSTORE_DIR = os.getenv("DOCSTORE_DIR")
+
+# Vocabolario BM25 scritto da pubmed_to_qdrant.py: se presente la ricerca è ibrida (densa + sparsa, fusione RRF)
+BM25_VOCAB = os.getenv("BM25_VOCAB")
+HYBRID_CANDIDATES = 4  # candidati per ramo della ricerca ibrida, in multipli di `limit`
+
+# Cache semantica delle risposte LLM (ANSWER_CACHE_SIZE=0 la disattiva)
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1000"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", str(24 * 3600)))
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+FINGERPRINT_TTL = 30  # secondi tra due controlli della collection
+
+# Token massimi del contesto passato all'LLM (titoli + abstract), vedi context_packer.py
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+
+QUERY_CACHE_SIZE = 1024  # embedding di domande tenuti in memoria (LRU)
+
+# Micro-batching degli embedding delle domande concorrenti (QUERY_BATCH_WAIT_MS=0 lo disattiva)
+QUERY_BATCH_WAIT_MS = float(os.getenv("QUERY_BATCH_WAIT_MS", "5"))
+QUERY_BATCH_MAX = int(os.getenv("QUERY_BATCH_MAX", "32"))
+
+@lru_cache(maxsize=None)
+def get_client():
+    if VECTOR_BACKEND == "local":
+        # Stessa interfaccia di query_points/get_collection, ricerca in-process senza rete
+        from common.local_vector_store import LocalVectorStore
+        return LocalVectorStore(LOCAL_STORE_DIR)
+    from qdrant_client import QdrantClient
+    return QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY)
+
+@lru_cache(maxsize=None)
+def get_embedding_model():
+    from langchain.embeddings import HuggingFaceEmbeddings  # o OpenAIEmbeddings
+    return HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
+
+@lru_cache(maxsize=None)
+def get_embedding_cache():
+    if not EMBEDDING_CACHE_DIR:
+        return None
+    from common.embedding_cache import EmbeddingCache
+    return EmbeddingCache(EMBEDDING_CACHE_DIR, EMBEDDING_MODEL_NAME, 384)
+
+_reloadable = {}  # nome → (fingerprint della collection, oggetto)
+_reload_lock = threading.Lock()
+
+def _reload_on_change(name, load):
+    """
+    Oggetto caricato da `load` e ricaricato quando cambia `collection_fingerprint()`: un processo residente
+    (search_service.py) vede così i documenti e il vocabolario di un'ingestione successiva all'avvio.
+    """
+    fingerprint = collection_fingerprint()
+    with _reload_lock:
+        cached = _reloadable.get(name)
+        if cached is None or cached[0] != fingerprint:
+            # Il vecchio oggetto non viene chiuso: può essere ancora in uso in un altro thread
+            cached = _reloadable[name] = (fingerprint, load())
+        return cached[1]
+
+def get_docstore():
+    if not DOCSTORE_DIR:
+        return None
+    from common.docstore import DocStore
+    return _reload_on_change("docstore", lambda: DocStore(DOCSTORE_DIR))
+
+def get_bm25_vocab():
+    # Il backend locale ha solo vettori densi
+    if VECTOR_BACKEND == "local" or not BM25_VOCAB or not os.path.exists(BM25_VOCAB):
+        return None
+    from common.bm25 import BM25Vocabulary
+    return _reload_on_change("bm25_vocab", lambda: BM25Vocabulary.load(BM25_VOCAB))
+
+@lru_cache(maxsize=None)
+def get_answer_cache():
+    if ANSWER_CACHE_SIZE <= 0:
+        return None
+    from answer_cache import AnswerCache
+    return AnswerCache(384, max_entries=ANSWER_CACHE_SIZE, ttl=ANSWER_CACHE_TTL, threshold=ANSWER_CACHE_THRESHOLD)
+
+_fingerprint = {"value": None, "checked": 0.0}
+
+def collection_fingerprint():
+    """
+    Identifica lo stato della collection (numero di punti + ora dell'ultimo caricamento scritta
+    da pubmed_to_qdrant.py); riletto al massimo ogni FINGERPRINT_TTL secondi.
+    """
+    now = time.monotonic()
+    if now - _fingerprint["checked"] > FINGERPRINT_TTL:
+        info = get_client().get_collection(COLLECTION_NAME)
+        metadata = getattr(info.config, "metadata", None) or {}
+        _fingerprint["value"] = (info.points_count, metadata.get("updated_at"))
+        _fingerprint["checked"] = now
+    return _fingerprint["value"]
+
+@lru_cache(maxsize=None)
+def get_qa_chain(streaming=False):
+    from langchain.chat_models import ChatOpenAI
+    from langchain.chains.question_answering import load_qa_chain
+    callbacks = None
+    if streaming:
+        # Stampa i token man mano che arrivano invece di attendere la risposta completa
+        from langchain.callbacks.streaming_stdout import StreamingStdOutCallbackHandler
+        callbacks = [StreamingStdOutCallbackHandler()]
+    llm = ChatOpenAI(openai_api_key=OPENAI_API_KEY, temperature=0, streaming=streaming, callbacks=callbacks)
+    return load_qa_chain(llm, chain_type="stuff")
+
+def normalize_question(question):
+    # Il modello MiniLM è uncased: maiuscole e spazi multipli non cambiano l'embedding
+    return " ".join(question.lower().split())
+
+def _encode_normalized(questions):
+    """
+    Embedding di domande già normalizzate con un solo forward pass per quelle non presenti nella cache su disco.
+    """
+    embedding_cache = get_embedding_cache()
+    if embedding_cache is None:
+        return get_embedding_model().embed_documents(questions)
+    vectors, missing = embedding_cache.get_many(questions)
+    vectors = vectors.tolist()
+    if missing:
+        missing_texts = [questions[i] for i in missing]
+        computed = get_embedding_model().embed_documents(missing_texts)
+        embedding_cache.put_many(missing_texts, computed)
+        for i, vector in zip(missing, computed):
+            vectors[i] = vector
+    return vectors
+
+@lru_cache(maxsize=None)
+def get_query_batcher():
+    if QUERY_BATCH_WAIT_MS <= 0:
+        return None
+    from micro_batcher import MicroBatcher
+    return MicroBatcher(embed_questions, max_batch=QUERY_BATCH_MAX, max_wait_ms=QUERY_BATCH_WAIT_MS)
+
+@lru_cache(maxsize=QUERY_CACHE_SIZE)
+def _embed_normalized(question):
+    batcher = get_query_batcher()
+    if batcher is not None:
+        # Le domande in arrivo da più thread nello stesso intervallo condividono un forward pass
+        return tuple(batcher(question))
+    return tuple(_encode_normalized([question])[0])
+
+@metrics.timed()
+def embed_question(question):
+    return list(_embed_normalized(normalize_question(question)))
+
+def embed_questions(questions):
+    # Più domande insieme (es. endpoint batch): le domande uguali dopo la normalizzazione vengono calcolate una volta
+    normalized = [normalize_question(q) for q in questions]
+    unique = list(dict.fromkeys(normalized))
+    by_text = dict(zip(unique, _encode_normalized(unique))) if unique else {}
+    return [list(by_text[q]) for q in normalized]
+
+def build_query(question, query_vector, query_filter, limit):
+    """
+    Argomenti `prefetch`/`query` per Qdrant. Con il vocabolario BM25 la ricerca densa e quella sparsa
+    girano nella stessa richiesta e i risultati vengono fusi con Reciprocal Rank Fusion;
+    senza vocabolario (o senza termini noti nella domanda) la ricerca è solo densa.
+    """
+    vocab = get_bm25_vocab()
+    indices, values = vocab.query_vector(question) if vocab is not None else ([], [])
+    if not indices:
+        return {"query": query_vector}
+
+    from qdrant_client.http import models
+    from common.bm25 import SPARSE_VECTOR_NAME
+    candidates = limit * HYBRID_CANDIDATES
+    return {
+        "prefetch": [
+            models.Prefetch(query=query_vector, filter=query_filter, limit=candidates),
+            models.Prefetch(
+                query=models.SparseVector(indices=indices, values=values),
+                using=SPARSE_VECTOR_NAME, filter=query_filter, limit=candidates,
+            ),
+        ],
+        "query": models.FusionQuery(fusion=models.Fusion.RRF),
+    }
+
+@metrics.timed()
+def search_qdrant(question, limit=5, date_from=None, date_to=None, authors=None, journal=None):
+    from common.search_filter import build_search_filter
+    query_vector = embed_question(question)
+    # I filtri vengono applicati da Qdrant durante la ricerca HNSW, non a posteriori
+    query_filter = build_search_filter(date_from=date_from, date_to=date_to, authors=authors, journal=journal)
+    with metrics.span("qdrant_query"):
+        search_result = get_client().query_points(
+            collection_name=COLLECTION_NAME,
+            query_filter=query_filter,
+            limit=limit,
+            with_payload=True,
+            **build_query(question, query_vector, query_filter, limit)
+        )
+    return search_result.points
+
+def hydrate_payloads(points):
+    """
+    Payload completi dei punti: con il payload ridotto titolo, abstract e DOI vengono letti dal docstore locale.
+    """
+    docstore = get_docstore()
+    payloads = []
+    for point in points:
+        payload = point.payload or {}
+        if docstore is not None and "abstract" not in payload:
+            payload = {**payload, **(docstore.get(payload.get("pmid")) or {})}
+        payloads.append(payload)
+    return payloads
 
 def build_documents_from_payload(results):
+    from langchain.schema import Document
     docs = []
-    for point in results:
-        payload = point.payload or {}
+    for point, payload in zip(results, hydrate_payloads(results)):
         content_parts = []
         if "title" in payload:
             content_parts.append(payload["title"])
@@ -40,29 +247,121 @@ def build_documents_from_payload(results):
             content_parts.append(payload["abstract"])
         content = "\n\n".join(content_parts).strip()
         if content:
-            docs.append(Document(page_content=content, metadata=payload))
+            docs.append(Document(page_content=content, metadata={**payload, "score": point.score}))
     return docs
 
-def generate_answer(docs, question):
-    llm = ChatOpenAI(openai_api_key=OPENAI_API_KEY, temperature=0)
-    qa_chain = load_qa_chain(llm, chain_type="stuff")
+@metrics.timed()
+def generate_answer(docs, question, verbose=True, stream=False):
+    from context_packer import pack_documents
+    qa_chain = get_qa_chain(streaming=stream)
+    # Contesto entro il budget di token: deduplicato, per score, abstract meno rilevanti tagliati a frasi
+    docs = pack_documents(docs, CONTEXT_TOKEN_BUDGET)
 
     # Stampa di debug: mostra contenuti dei documenti prima di generare la risposta
-    print(f"Trovati {len(docs)} documenti:")
-    for i, doc in enumerate(docs, 1):
-        print(f"\nDocumento {i} (prime 500 caratteri):")
-        print(doc.page_content[:500] + "...\n")
+    if verbose:
+        print(f"Trovati {len(docs)} documenti:")
+        for i, doc in enumerate(docs, 1):
+            print(f"\nDocumento {i} (prime 500 caratteri):")
+            print(doc.page_content[:500] + "...\n")
 
+    if stream:
+        # Intestazione subito prima dei token, dopo l'eventuale stampa di debug dei documenti
+        print("\nRisposta generata:")
     answer = qa_chain.run(input_documents=docs, question=question)
     return answer
 
-if __name__ == "__main__":
-    question = input("Inserisci la tua domanda:\n> ")
-    results = search_qdrant(question)
+def answer_with_cache(docs, question, verbose=True, stream=False):
+    """
+    Come generate_answer, ma riusa la risposta di una domanda quasi identica con le stesse fonti.
+    """
+    answer_cache = get_answer_cache()
+    if answer_cache is None:
+        return generate_answer(docs, question, verbose=verbose, stream=stream)
+    query_vector = embed_question(question)  # già nella LRU dopo la ricerca
+    pmids = [doc.metadata.get("pmid") for doc in docs]
+    fingerprint = collection_fingerprint()
+    answer = answer_cache.get(query_vector, pmids, fingerprint)
+    metrics.count("answer_cache", result="miss" if answer is None else "hit")
+    if answer is None:
+        answer = generate_answer(docs, question, verbose=verbose, stream=stream)
+        answer_cache.put(query_vector, pmids, answer, fingerprint)
+    elif stream:
+        print("\nRisposta generata:")
+        print(answer, end="", flush=True)
+    return answer
+
+def warm_up():
+    """
+    Carica in anticipo client, modello di embedding e catena QA (una sola volta per processo).
+    """
+    get_client()
+    get_embedding_model().embed_query("warm up")
+    get_query_batcher()
+    get_embedding_cache()
+    get_docstore()
+    get_bm25_vocab()
+    get_answer_cache()
+    get_qa_chain()
+
+def answer_question(question, search_args, verbose=True, stream=False):
+    timings = {}
+    t0 = time.perf_counter()
+    embed_question(question)
+    timings["embedding"] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    results = search_qdrant(question, **search_args)
     docs = build_documents_from_payload(results)
+    timings["ricerca"] = time.perf_counter() - t0
 
     if not docs:
         print("Nessun documento rilevante trovato.")
     else:
-        answer = generate_answer(docs, question)
-        print("\nRisposta generata:\n", answer)
+        t0 = time.perf_counter()
+        if stream:
+            # L'intestazione viene stampata da generate_answer/answer_with_cache, subito prima della risposta
+            answer_with_cache(docs, question, verbose=verbose, stream=True)
+            print()
+        else:
+            answer = answer_with_cache(docs, question, verbose=verbose)
+            print("\nRisposta generata:\n", answer)
+        timings["LLM"] = time.perf_counter() - t0
+
+    print("⏱️ " + ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in timings.items()))
+
+def repl(search_args, stream=False):
+    print("Modalità interattiva: una domanda per riga, riga vuota o Ctrl-D per uscire.")
+    while True:
+        try:
+            question = input("\n> ").strip()
+        except (EOFError, KeyboardInterrupt):
+            print()
+            break
+        if not question:
+            break
+        answer_question(question, search_args, verbose=False, stream=stream)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Domande su PubMed con ricerca su Qdrant e risposta LLM")
+    parser.add_argument("--limit", type=int, default=5, help="Numero di articoli da recuperare")
+    parser.add_argument("--from", dest="date_from", help="Data di pubblicazione minima (YYYY, YYYY-MM o YYYY-MM-DD)")
+    parser.add_argument("--to", dest="date_to", help="Data di pubblicazione massima (YYYY, YYYY-MM o YYYY-MM-DD)")
+    parser.add_argument("--author", action="append", dest="authors", help="Autore (ripetibile, basta che ne compaia uno)")
+    parser.add_argument("--journal", help="Nome esatto della rivista")
+    parser.add_argument("--stream", action="store_true", help="Stampa la risposta man mano che viene generata")
+    parser.add_argument("--interactive", "-i", action="store_true", help="Più domande di seguito con modello e catena residenti")
+    args = parser.parse_args()
+
+    search_args = {
+        "limit": args.limit, "date_from": args.date_from, "date_to": args.date_to,
+        "authors": args.authors, "journal": args.journal,
+    }
+
+    if args.interactive:
+        t0 = time.perf_counter()
+        warm_up()
+        print(f"⏱️ Avvio: {time.perf_counter() - t0:.1f} s")
+        repl(search_args, stream=args.stream)
+    else:
+        question = input("Inserisci la tua domanda:\n> ")
+        answer_question(question, search_args, stream=args.stream)
@@ -1,4 +1,6 @@
+import argparse
 import os
+import sys
 from dotenv import load_dotenv
 
 from qdrant_client import QdrantClient
@@ -7,6 +9,9 @@ from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_openai import ChatOpenAI
 from langchain.chains import RetrievalQA
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from common.search_filter import build_search_filter  # noqa: E402
+
 load_dotenv()
 qdrant_url = os.getenv("QDRANT_URL", "http://localhost:6333")
 qdrant_api_key = os.getenv("QDRANT_API_KEY")
@@ -22,21 +27,29 @@ vectorstore = QdrantVectorStore(
     embedding=embedding_model,
 )
 
-# definizione retriever con with_payload True
-retriever = vectorstore.as_retriever(search_kwargs={"k": 5, "with_payload": True})
-
 # definizione modello linguistico LLM
 llm = ChatOpenAI(openai_api_key=openai_api_key, temperature=0.2)
 
-# definizione catena QA
-qa_chain = RetrievalQA.from_chain_type(
-    llm=llm,
-    retriever=retriever,
-    return_source_documents=True,
-)
-def run_query(question: str):
+def build_qa_chain(search_filter=None):
+    # definizione retriever con with_payload True; il filtro (date/autori/rivista) viene applicato da Qdrant
+    search_kwargs = {"k": 5, "with_payload": True}
+    if search_filter is not None:
+        search_kwargs["filter"] = search_filter
+    retriever = vectorstore.as_retriever(search_kwargs=search_kwargs)
+
+    # definizione catena QA
+    return RetrievalQA.from_chain_type(
+        llm=llm,
+        retriever=retriever,
+        return_source_documents=True,
+    )
+
+qa_chain = build_qa_chain()
+
+def run_query(question: str, search_filter=None):
     print(f"\n🧠 Domanda: {question}")
-    result = qa_chain.invoke({"query": question})
+    chain = qa_chain if search_filter is None else build_qa_chain(search_filter)
+    result = chain.invoke({"query": question})
 
     print("\n📋 Risposta generata:")
     print(result["result"])
@@ -65,5 +78,13 @@ def run_query(question: str):
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--from", dest="date_from", help="Data di pubblicazione minima (YYYY, YYYY-MM o YYYY-MM-DD)")
+    parser.add_argument("--to", dest="date_to", help="Data di pubblicazione massima")
+    parser.add_argument("--author", action="append", dest="authors", help="Autore (ripetibile)")
+    parser.add_argument("--journal", help="Nome esatto della rivista")
+    args = parser.parse_args()
+    search_filter = build_search_filter(args.date_from, args.date_to, args.authors, args.journal)
+
     domanda = input("🤖 Inserisci la tua domanda (es. quali sono le nuove terapie per il cancro al colon?):\n> ")
-    run_query(domanda)
+    run_query(domanda, search_filter)
@@ -0,0 +1,201 @@
+import argparse
+import asyncio
+import os
+import sys
+import time
+from contextlib import asynccontextmanager
+from typing import List, Optional
+
+from dotenv import load_dotenv
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel, Field
+from qdrant_client import AsyncQdrantClient
+from qdrant_client.http import models
+
+load_dotenv()
+
+SEARCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(SEARCH_DIR, ".."))
+sys.path.insert(0, SEARCH_DIR)
+from common import metrics  # noqa: E402
+from common.search_filter import build_search_filter  # noqa: E402
+import minimal_llm  # noqa: E402
+
+MAX_BATCH_QUERIES = 64
+PREFER_GRPC = os.getenv("QDRANT_PREFER_GRPC", "false").lower() in ("1", "true", "yes")
+
+
+class SearchRequest(BaseModel):
+    question: str
+    limit: int = Field(5, ge=1, le=100)
+    date_from: Optional[str] = None
+    date_to: Optional[str] = None
+    authors: Optional[List[str]] = None
+    journal: Optional[str] = None
+
+
+class BatchSearchRequest(BaseModel):
+    queries: List[SearchRequest] = Field(..., min_length=1, max_length=MAX_BATCH_QUERIES)
+
+
+class LocalAsyncClient:
+    """
+    Adatta `LocalVectorStore` (VECTOR_BACKEND=local) ai metodi di AsyncQdrantClient usati dal servizio:
+    la ricerca è CPU-bound e gira in un thread per non bloccare l'event loop.
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    async def query_points(self, **kwargs):
+        return await asyncio.to_thread(self.store.query_points, **kwargs)
+
+    async def query_batch_points(self, collection_name, requests):
+        def run():
+            return [
+                self.store.query_points(collection_name=collection_name, query=r.query, query_filter=r.filter,
+                                        limit=r.limit, with_payload=r.with_payload)
+                for r in requests
+            ]
+        return await asyncio.to_thread(run)
+
+    async def get_collection(self, collection_name):
+        return self.store.get_collection(collection_name)
+
+    async def close(self):
+        pass
+
+
+@asynccontextmanager
+async def lifespan(app):
+    """
+    Carica modello di embedding, catena QA e client Qdrant una sola volta all'avvio del servizio.
+    """
+    t0 = time.perf_counter()
+    if minimal_llm.VECTOR_BACKEND == "local":
+        # Indice locale in-process: nessun server Qdrant
+        app.state.qdrant = LocalAsyncClient(minimal_llm.get_client())
+    else:
+        # Client asincrono: un pool di connessioni condiviso da tutte le richieste
+        app.state.qdrant = AsyncQdrantClient(
+            url=minimal_llm.QDRANT_URL, api_key=minimal_llm.QDRANT_API_KEY, prefer_grpc=PREFER_GRPC
+        )
+    await asyncio.to_thread(minimal_llm.warm_up)
+    print(f"⏱️ Servizio pronto in {time.perf_counter() - t0:.1f} s")
+    yield
+    await app.state.qdrant.close()
+
+
+app = FastAPI(title="OncoDB search", lifespan=lifespan)
+
+
+def _query_filter(request):
+    try:
+        return build_search_filter(request.date_from, request.date_to, request.authors, request.journal)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
+def _serialize(points):
+    # Letture dal docstore (ed eventuale riapertura dopo una nuova ingestione): chiamata in un thread
+    return [
+        {"id": point.id, "score": point.score, "payload": payload}
+        for point, payload in zip(points, minimal_llm.hydrate_payloads(points))
+    ]
+
+
+async def _search(request):
+    query_filter = _query_filter(request)
+    # L'embedding è CPU-bound: gira in un thread per non bloccare l'event loop
+    query_vector = await asyncio.to_thread(minimal_llm.embed_question, request.question)
+    # Il vocabolario BM25 può essere ricaricato dopo una nuova ingestione: anche questo fuori dall'event loop
+    query = await asyncio.to_thread(minimal_llm.build_query, request.question, query_vector, query_filter, request.limit)
+    with metrics.span("qdrant_query"):
+        response = await app.state.qdrant.query_points(
+            collection_name=minimal_llm.COLLECTION_NAME,
+            query_filter=query_filter,
+            limit=request.limit,
+            with_payload=True,
+            **query,
+        )
+    return response.points
+
+
+@app.get("/")
+async def root():
+    return {"message": "PubMed Qdrant search service running"}
+
+
+@app.get("/count")
+async def count_points():
+    stats = await app.state.qdrant.get_collection(minimal_llm.COLLECTION_NAME)
+    return {"points_count": stats.points_count}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """
+    Metriche del processo in formato Prometheus, lette a ogni scrape (registrate solo con METRICS_EXPORT impostata).
+    """
+    return PlainTextResponse(metrics.prometheus_text(), media_type="text/plain; version=0.0.4")
+
+
+@app.post("/search")
+async def search(request: SearchRequest):
+    t0 = time.perf_counter()
+    points = await _search(request)
+    results = await asyncio.to_thread(_serialize, points)
+    return {"results": results, "took_ms": round((time.perf_counter() - t0) * 1000, 1)}
+
+
+@app.post("/search/batch")
+async def search_batch(request: BatchSearchRequest):
+    """
+    Più ricerche in una richiesta: un solo forward pass del modello per tutte le domande
+    e una sola chiamata batch a Qdrant.
+    """
+    t0 = time.perf_counter()
+    filters = [_query_filter(q) for q in request.queries]
+    vectors = await asyncio.to_thread(minimal_llm.embed_questions, [q.question for q in request.queries])
+    queries = await asyncio.to_thread(lambda: [
+        minimal_llm.build_query(q.question, vector, query_filter, q.limit)
+        for q, vector, query_filter in zip(request.queries, vectors, filters)
+    ])
+    with metrics.span("qdrant_query", batch="true"):
+        responses = await app.state.qdrant.query_batch_points(
+            collection_name=minimal_llm.COLLECTION_NAME,
+            requests=[
+                models.QueryRequest(filter=query_filter, limit=q.limit, with_payload=True, **query)
+                for q, query_filter, query in zip(request.queries, filters, queries)
+            ],
+        )
+    return {
+        "results": await asyncio.to_thread(lambda: [_serialize(response.points) for response in responses]),
+        "took_ms": round((time.perf_counter() - t0) * 1000, 1),
+    }
+
+
+@app.post("/answer")
+async def answer(request: SearchRequest):
+    t0 = time.perf_counter()
+    points = await _search(request)
+    docs = await asyncio.to_thread(minimal_llm.build_documents_from_payload, points)
+    if not docs:
+        return {"answer": None, "sources": [], "took_ms": round((time.perf_counter() - t0) * 1000, 1)}
+    answer_text = await asyncio.to_thread(minimal_llm.answer_with_cache, docs, request.question, False)
+    return {
+        "answer": answer_text,
+        "sources": [doc.metadata.get("pmid") for doc in docs],
+        "took_ms": round((time.perf_counter() - t0) * 1000, 1),
+    }
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Servizio di ricerca PubMed (FastAPI)")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port)